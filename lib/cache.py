@@ -0,0 +1,108 @@
+"""
+Small process-local caches.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    A thread safe, size bounded mapping with optional
+    expiry. When full, the least recently used entry is
+    evicted. Hits, misses and evictions are counted so
+    the cache can be watched in production via stats().
+
+    cache = LRUCache(max_size = 500, ttl = 60)
+    cache.set('key', value)
+    cache.get('key', default)
+    """
+    def __init__(self, max_size=1000, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored under key, or default if
+        it is missing or expired.
+        """
+        self._lock.acquire()
+        try:
+            try:
+                expires, value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires < time.time():
+                self.misses += 1
+                return default
+            # Re-insert to mark as most recently used.
+            self._data[key] = (expires, value)
+            self.hits += 1
+            return value
+        finally:
+            self._lock.release()
+
+    def set(self, key, value, ttl=None):
+        """
+        Stores value under key. `ttl` overrides the
+        cache-wide ttl for this entry.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        expires = time.time() + ttl if ttl is not None else None
+        self._lock.acquire()
+        try:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last = False)
+                self.evictions += 1
+        finally:
+            self._lock.release()
+
+    def delete(self, key):
+        self._lock.acquire()
+        try:
+            self._data.pop(key, None)
+        finally:
+            self._lock.release()
+
+    def delete_where(self, test):
+        """
+        Removes every entry for which test(key, value)
+        returns True.
+        """
+        self._lock.acquire()
+        try:
+            for key, (expires, value) in self._data.items():
+                if test(key, value):
+                    del self._data[key]
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._data.clear()
+        finally:
+            self._lock.release()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._data),
+        }
+
+    def __len__(self):
+        return len(self._data)
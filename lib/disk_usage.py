@@ -0,0 +1,84 @@
+"""
+Measuring the size of account directories for the
+subscription.disk() regulator.
+"""
+import os
+import stat
+import time
+
+
+def kilobytes(size):
+    """
+    Bytes -> kilobytes, rounded up, so every file counts.
+    """
+    return (size + 1023) // 1024
+
+
+def tree_kilobytes(path):
+    """
+    Returns the size of the files under path in kilobytes,
+    each file rounded up. Walks the tree with one listdir()
+    and one lstat() per entry, without recursion or following
+    symlinks. Entries that vanish mid-scan are skipped. A
+    missing path is 0.
+    """
+    total = 0
+    pending = [path]
+    while pending:
+        directory = pending.pop()
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        for name in names:
+            entry = os.path.join(directory, name)
+            try:
+                info = os.lstat(entry)
+            except OSError:
+                continue
+            if stat.S_ISDIR(info.st_mode):
+                pending.append(entry)
+            elif stat.S_ISREG(info.st_mode):
+                total += kilobytes(info.st_size)
+    return total
+
+
+def scan_accounts(regulator, limit=None, pause=0.1, progress=None):
+    """
+    Rescans the directories of up to `limit` accounts for a
+    subscription.DiskRegulator, least recently scanned first,
+    sleeping `pause` seconds between accounts. Each total is
+    saved as soon as it is measured, so an interrupted run
+    loses nothing and the next one carries on where it
+    stopped. `progress`, if given, is called as
+    progress(account, kilobytes). Returns the number of
+    accounts scanned.
+    """
+    from account.models import Account, DiskUsage
+
+    accounts = dict([(account.id, account) for account in Account.objects.all()])
+    scanned = set()
+    stale = []
+    for usage in DiskUsage.objects.order_by('scanned'):
+        account = accounts.get(usage.account_id)
+        if account is not None and usage.directory == regulator.path(account):
+            scanned.add(account.id)
+            stale.append(account.id)
+    # Accounts that were never scanned go first.
+    account_ids = [
+        account_id for account_id in sorted(accounts.keys())
+        if account_id not in scanned
+    ] + stale
+    if limit is not None:
+        account_ids = account_ids[:limit]
+
+    done = 0
+    for account_id in account_ids:
+        account = accounts[account_id]
+        total = DiskUsage.scan(account, regulator.path(account))
+        done += 1
+        if progress:
+            progress(account, total)
+        if done < len(account_ids):
+            time.sleep(pause)
+    return done
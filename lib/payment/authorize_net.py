@@ -1,9 +1,19 @@
-import urllib2
-from xml.dom import minidom
+import re
+from xml.parsers import expat
+from xml.sax.saxutils import escape
 from xml.parsers.expat import ExpatError
 from datetime import date, timedelta
 from time import strftime
 from errors import PaymentRequestError, PaymentResponseError
+from connections import ConnectionPool
+
+# Shared by every call. Replace it, or change its attributes,
+# to tune the pool size and timeouts.
+pool = ConnectionPool(
+    max_size = 4,
+    connect_timeout = 10,
+    read_timeout = 60,
+)
 
 def start_payment(url, login, password, token, amount, card_number, 
                   card_expires, first_name, last_name, period=1, 
@@ -23,7 +33,7 @@ def start_payment(url, login, password, token, amount, card_number,
     
     return _make_request(
         url, 
-        _populate(_start_payment_xml, **locals())
+        _start_payment.render(locals())
     )
     
 
@@ -33,7 +43,7 @@ def change_payment(url, login, password, gateway_token, amount):
     """
     return _make_request(
         url, 
-        _populate(_change_payment_xml, **locals())
+        _change_payment.render(locals())
     )
 
 def cancel_payment(url, login, password, gateway_token):
@@ -42,71 +52,134 @@ def cancel_payment(url, login, password, gateway_token):
     """
     return _make_request(
         url, 
-        _populate(_cancel_payment_xml, **locals())
+        _cancel_payment.render(locals())
     )
 
-def _populate(template, **values):
+_slot_re = re.compile(r'\{\{ (\w+) \}\}')
+
+class _Template(object):
     """
-    Places values into an template. Used to create the
-    xml requests sent to Authorize.net
+    An xml request template, split once into its literal
+    text and the {{ name }} slots between. render() fills 
+    the slots with xml escaped values in a single join. Used
+    to create the xml requests sent to Authorize.net
     """
-    for key in values:
-        template = template.replace(
-            '{{ %s }}' % str(key),
-            str(values[key])
-        )
-    return template
-def _make_request(url, content, content_type='text/xml'):
+    def __init__(self, source):
+        # Literal text at even positions, slot names at odd.
+        self.segments = _slot_re.split(source)
+        self.slots = [
+            (i, self.segments[i]) for i in range(1, len(self.segments), 2)
+        ]
+        
+    def render(self, values):
+        segments = self.segments[:]
+        for i, name in self.slots:
+            segments[i] = _xml_value(values[name])
+        return ''.join(segments)
+    
+def _xml_value(value):
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return escape(str(value))
+
+def _make_request(url, content, content_type='text/xml'):
     """
-    Sends the request xml to the payment gateway. Returns
-    gateway_token on success.
+    Sends the request xml to the payment gateway over a
+    pooled keep-alive connection. Returns gateway_token on 
+    success.
     """
-    request = urllib2.Request(
-        url, 
-        content, 
-        {'Content-Type': content_type}
-    )
-    
     return _process_response(
-        urllib2.urlopen(request).read()
+        pool.post(url, content, {'Content-Type': content_type})
     )
     
     
+class _Done(Exception):
+    pass
+
+
+class _ResponseReader(object):
+    """
+    Collects, in one expat pass, the text of the first 
+    resultCode and subscriptionId elements and of every 
+    code and text element. Like the minidom version, only 
+    text directly inside an element counts. Parsing stops 
+    as soon as a successful reply's subscriptionId is read.
+    """
+    wanted = ('resultCode', 'subscriptionId', 'code', 'text')
+    
+    def __init__(self):
+        self.result_code = None
+        self.subscription_id = None
+        self.codes = []
+        self.texts = []
+        # Text buffers of the open elements; None for 
+        # elements we don't want.
+        self._stack = []
+        
+    def parse(self, xml):
+        parser = expat.ParserCreate()
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        parser.CharacterDataHandler = self.data
+        parser.buffer_text = True
+        try:
+            parser.Parse(xml, True)
+        except _Done:
+            pass
+        
+    def start(self, name, attributes):
+        if name in self.wanted:
+            self._stack.append([])
+        else:
+            self._stack.append(None)
+        
+    def data(self, text):
+        if self._stack and self._stack[-1] is not None:
+            self._stack[-1].append(text)
+        
+    def end(self, name):
+        text = self._stack.pop()
+        if text is None:
+            return
+        text = ''.join(text)
+        if name == 'resultCode':
+            if self.result_code is None:
+                self.result_code = text
+        elif name == 'subscriptionId':
+            if self.subscription_id is None:
+                self.subscription_id = text
+        elif name == 'code':
+            self.codes.append(text)
+        else:
+            self.texts.append(text)
+        if (self.subscription_id is not None and self.result_code is not None 
+                and self.result_code.strip().lower() == 'ok'):
+            raise _Done
+    
+    
 def _process_response(xml):
     """
     Parses the xml response from the payment gateway.
     On success, returns gateway_token. On failure, 
     it raises either PaymentRequestError or PaymentResponseError
     """
+    reader = _ResponseReader()
     try:
-        dom = minidom.parseString(xml)
+        reader.parse(xml)
     except ExpatError:
         raise PaymentResponseError(xml)
     
-    def text(node):
-        return ''.join(
-            [n.data for n in node.childNodes if n.nodeType == n.TEXT_NODE]
+    # A missing resultCode is an unknown response.
+    result = (reader.result_code or '').strip().lower()
+    if result == 'ok':
+        if reader.subscription_id is not None:
+            return reader.subscription_id
+        return True
+    elif result == 'error':
+        raise PaymentRequestError(
+            zip(reader.codes, reader.texts)
         )
     
-    def get(tag_name, dom = dom):
-        return [text(e) for e in dom.getElementsByTagName(tag_name)]
-        
-    def eq(tag_name, value):
-        return get(tag_name)[0].strip().lower() == value.lower()
-        
-    try:
-        if eq('resultCode', 'ok'):
-            id = get('subscriptionId')
-            return id[0] if id else True
-        elif eq('resultCode', 'error'):
-            raise PaymentRequestError(
-                zip(get('code'), get('text'))
-            )
-    except IndexError:
-        # Index error is raised if an expected
-        # field is missing.
-        pass
-    
     raise PaymentResponseError(xml)
     
             
@@ -176,6 +249,10 @@ xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">
 </ARBCancelSubscriptionRequest>   
 """
 
+_start_payment = _Template(_start_payment_xml)
+_change_payment = _Template(_change_payment_xml)
+_cancel_payment = _Template(_cancel_payment_xml)
+
 
 if __name__ == '__main__':
     
@@ -0,0 +1,118 @@
+"""
+Runs many payment gateway calls at once, for batch jobs.
+"""
+import threading
+import time
+from ..pool import WorkerPool, TaskTimeout
+from errors import PaymentResponseError
+
+
+class GatewayCall(object):
+    """
+    A gateway call submitted to a ConcurrentGateway.
+    """
+    def __init__(self, operation, kwargs, timeout):
+        self.operation = operation
+        self.kwargs = kwargs
+        self.timeout = timeout
+        self.deadline = None
+        self.task = None
+        self._started = threading.Event()
+        
+    def result(self):
+        """
+        Waits for the call and returns what the gateway 
+        function returned, or raises what it raised. Raises
+        PaymentResponseError if the call runs past its 
+        deadline; the gateway may or may not have acted on it.
+        """
+        if self.timeout is None:
+            return self.task.wait()
+        self._started.wait()
+        try:
+            return self.task.wait(max(self.deadline - time.time(), 0))
+        except TaskTimeout:
+            raise PaymentResponseError(
+                '%s did not finish before its deadline' % self.operation
+            )
+    
+    def _start(self):
+        if self.timeout is not None:
+            self.deadline = time.time() + self.timeout
+        self._started.set()
+    
+    
+class ConcurrentGateway(object):
+    """
+    Wraps a gateway module (e.g. authorize_net) so its calls
+    run on up to `max_concurrency` threads at once. Each call
+    gets `timeout` seconds from when a thread starts it, so
+    calls waiting their turn don't time out.
+    
+    gateway = ConcurrentGateway(authorize_net, max_concurrency = 20)
+    calls = [
+        gateway.change_payment(url = URL, login = LOGIN, password = PASSWORD,
+                               gateway_token = token, amount = '19.95')
+        for token in tokens
+    ]
+    for call in calls:
+        call.result()
+    gateway.close()
+        
+    Give the gateway's connection pool at least max_concurrency
+    connections, so they are all reused.
+    """
+    def __init__(self, gateway, max_concurrency=10, timeout=60):
+        self.gateway = gateway
+        self.timeout = timeout
+        self._pool = WorkerPool(max_concurrency)
+        
+    def start_payment(self, **kwargs):
+        return self.submit('start_payment', kwargs)
+    
+    def change_payment(self, **kwargs):
+        return self.submit('change_payment', kwargs)
+    
+    def cancel_payment(self, **kwargs):
+        return self.submit('cancel_payment', kwargs)
+    
+    def submit(self, operation, kwargs, timeout=None):
+        """
+        Queues gateway.operation(**kwargs). Returns a GatewayCall.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        call = GatewayCall(operation, kwargs, timeout)
+        call.task = self._pool.submit(self._run, call)
+        return call
+    
+    def run_all(self, operation, calls, timeout=None):
+        """
+        Runs gateway.operation once for each kwargs dict in
+        calls, concurrently. Yields (kwargs, result, error) 
+        tuples in the order the calls were given, where error
+        is None or the exception the call raised.
+        """
+        submitted = [self.submit(operation, kwargs, timeout) for kwargs in calls]
+        for call in submitted:
+            try:
+                yield call.kwargs, call.result(), None
+            except Exception, e:
+                yield call.kwargs, None, e
+    
+    def close(self):
+        """
+        Stops the worker threads once the submitted calls are 
+        done. 
+        """
+        self._pool.close()
+        
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def _run(self, call):
+        call._start()
+        return getattr(self.gateway, call.operation)(**call.kwargs)
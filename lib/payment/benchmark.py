@@ -0,0 +1,73 @@
+"""
+Compares authorize_net._process_response with the minidom
+based parser it replaced, on typical gateway replies.
+
+    python lib/payment/benchmark.py [iterations]
+"""
+import sys
+import timeit
+from xml.dom import minidom
+from xml.parsers.expat import ExpatError
+from authorize_net import _process_response
+from errors import PaymentRequestError, PaymentResponseError
+from sample_responses import OK, ERROR, GARBAGE
+
+
+def _process_response_minidom(xml):
+    """
+    The old parser, kept here for comparison.
+    """
+    try:
+        dom = minidom.parseString(xml)
+    except ExpatError:
+        raise PaymentResponseError(xml)
+    
+    def text(node):
+        return ''.join(
+            [n.data for n in node.childNodes if n.nodeType == n.TEXT_NODE]
+        )
+    
+    def get(tag_name, dom = dom):
+        return [text(e) for e in dom.getElementsByTagName(tag_name)]
+        
+    def eq(tag_name, value):
+        return get(tag_name)[0].strip().lower() == value.lower()
+        
+    try:
+        if eq('resultCode', 'ok'):
+            id = get('subscriptionId')
+            return id[0] if id else True
+        elif eq('resultCode', 'error'):
+            raise PaymentRequestError(
+                zip(get('code'), get('text'))
+            )
+    except IndexError:
+        pass
+    
+    raise PaymentResponseError(xml)
+
+
+def outcome(parse, xml):
+    try:
+        return 'returned', parse(xml)
+    except PaymentRequestError, e:
+        return 'PaymentRequestError', e.messages
+    except PaymentResponseError, e:
+        return 'PaymentResponseError', e.response
+
+
+def main(iterations=10000):
+    for name, xml in (('ok', OK), ('error', ERROR), ('garbage', GARBAGE)):
+        assert outcome(_process_response, xml) == outcome(_process_response_minidom, xml), name
+        
+        times = []
+        for parse in (_process_response_minidom, _process_response):
+            timer = timeit.Timer(lambda: outcome(parse, xml))
+            times.append(min(timer.repeat(3, iterations)) / iterations * 1e6)
+        print '%-8s minidom %7.1f us   expat %7.1f us   %.1fx' % (
+            name, times[0], times[1], times[0] / times[1]
+        )
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,135 @@
+"""
+Keep-alive HTTPS connections for the payment gateway
+modules, with connect and read timeouts.
+"""
+import httplib
+import select
+import socket
+import threading
+import urlparse
+from errors import PaymentResponseError
+
+
+class ConnectionPool(object):
+    """
+    Keeps up to `max_size` idle keep-alive connections per
+    host, so consecutive gateway calls skip the TCP and TLS
+    handshakes. Connecting may take `connect_timeout` seconds
+    and each read `read_timeout` seconds; a slow or dead
+    gateway raises PaymentResponseError instead of tying up
+    the caller. Thread safe.
+
+    pool = ConnectionPool(max_size = 4)
+    body = pool.post(url, xml, {'Content-Type': 'text/xml'})
+    """
+    def __init__(self, max_size=4, connect_timeout=10, read_timeout=60):
+        self.max_size = max_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        # (scheme, host) -> idle connections
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def post(self, url, body, headers=None):
+        """
+        POSTs body to url and returns the response body. Idle
+        connections the server has closed are dropped before
+        use. A request is never sent twice: once any of it may
+        have reached the gateway, a failure is raised rather
+        than retried, since the call might have gone through.
+        """
+        scheme, host, path, query, fragment = urlparse.urlsplit(url)
+        if query:
+            path += '?' + query
+        headers = dict(headers or {})
+        headers.setdefault('Connection', 'keep-alive')
+
+        connection = self._get(scheme, host)
+        try:
+            try:
+                connection.request('POST', path, body, headers)
+            except httplib.CannotSendRequest:
+                # Raised before anything is written.
+                connection.close()
+                connection = self._connect(scheme, host)
+                connection.request('POST', path, body, headers)
+            response = connection.getresponse()
+            content = response.read()
+        except socket.timeout, e:
+            connection.close()
+            raise PaymentResponseError('Timed out talking to %s: %s' % (host, e))
+        except (httplib.HTTPException, socket.error), e:
+            connection.close()
+            raise PaymentResponseError('Error talking to %s: %r' % (host, e))
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._put(scheme, host, connection)
+        return content
+
+    def close(self):
+        """
+        Closes every idle connection.
+        """
+        self._lock.acquire()
+        try:
+            idle, self._idle = self._idle, {}
+        finally:
+            self._lock.release()
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def _get(self, scheme, host):
+        self._lock.acquire()
+        try:
+            idle = self._idle.get((scheme, host)) or []
+            while idle:
+                connection = idle.pop()
+                if not _dropped(connection):
+                    return connection
+                connection.close()
+        finally:
+            self._lock.release()
+        return self._connect(scheme, host)
+
+    def _put(self, scheme, host, connection):
+        self._lock.acquire()
+        try:
+            idle = self._idle.setdefault((scheme, host), [])
+            if len(idle) < self.max_size:
+                idle.append(connection)
+                return
+        finally:
+            self._lock.release()
+        connection.close()
+
+    def _connect(self, scheme, host):
+        if scheme == 'https':
+            connection = httplib.HTTPSConnection(host, timeout = self.connect_timeout)
+        else:
+            connection = httplib.HTTPConnection(host, timeout = self.connect_timeout)
+        try:
+            connection.connect()
+        except socket.timeout, e:
+            raise PaymentResponseError('Timed out connecting to %s: %s' % (host, e))
+        except socket.error, e:
+            raise PaymentResponseError('Could not connect to %s: %r' % (host, e))
+        connection.sock.settimeout(self.read_timeout)
+        return connection
+
+
+def _dropped(connection):
+    """
+    True if an idle connection can't be reused. Its socket
+    only becomes readable once the server has closed it (or
+    sent something nobody asked for).
+    """
+    if connection.sock is None:
+        return True
+    try:
+        readable, writable, failed = select.select([connection.sock], [], [], 0)
+    except (select.error, socket.error, ValueError):
+        return True
+    return bool(readable)
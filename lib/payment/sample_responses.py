@@ -0,0 +1,36 @@
+"""
+Sample Authorize.net ARB replies, for benchmark.py and
+the tests.
+"""
+
+OK = """<?xml version="1.0" encoding="utf-8"?>
+<ARBCreateSubscriptionResponse xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">
+  <refId>Sample</refId>
+  <messages>
+    <resultCode>Ok</resultCode>
+    <message>
+      <code>I00001</code>
+      <text>Successful.</text>
+    </message>
+  </messages>
+  <subscriptionId>100748</subscriptionId>
+</ARBCreateSubscriptionResponse>
+"""
+
+ERROR = """<?xml version="1.0" encoding="utf-8"?>
+<ErrorResponse xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">
+  <messages>
+    <resultCode>Error</resultCode>
+    <message>
+      <code>E00003</code>
+      <text>The element 'amount' has an invalid value.</text>
+    </message>
+    <message>
+      <code>E00012</code>
+      <text>A duplicate subscription already exists.</text>
+    </message>
+  </messages>
+</ErrorResponse>
+"""
+
+GARBAGE = "<html><body>Service Unavailable</body></html>"
@@ -0,0 +1,117 @@
+"""
+A small pool of daemon worker threads, for running slow
+calls with a deadline.
+"""
+import Queue
+import sys
+import threading
+
+
+class TaskTimeout(Exception):
+    """
+    Raised by Task.wait() if the task isn't done in time.
+    """
+    pass
+
+
+class Task(object):
+    """
+    A call submitted to a WorkerPool.
+    """
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def run(self):
+        try:
+            self.result = self.function(*self.args)
+        except:
+            self.error = sys.exc_info()
+        self._done.set()
+
+    def done(self):
+        return self._done.isSet()
+
+    def wait(self, timeout=None):
+        """
+        Returns the result, re-raising any exception the call
+        raised. Raises TaskTimeout if the call hasn't finished
+        after `timeout` seconds; it keeps running regardless.
+        """
+        self._done.wait(timeout)
+        if not self._done.isSet():
+            raise TaskTimeout(self.function)
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        return self.result
+
+
+class WorkerPool(object):
+    """
+    Runs calls on up to `size` daemon threads, started as
+    they are needed.
+
+    pool = WorkerPool(4)
+    task = pool.submit(function, arg1, arg2)
+    task.wait(timeout = 0.5)
+    pool.close()
+    """
+    def __init__(self, size=4):
+        self.size = size
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._idle = 0
+        self._lock = threading.Lock()
+
+    def submit(self, function, *args):
+        task = Task(function, args)
+        self._lock.acquire()
+        try:
+            # Hand the task to an idle thread, counting that
+            # thread as busy straight away so a burst of submits
+            # starts new threads rather than queueing behind it.
+            if self._idle:
+                self._idle -= 1
+            elif len(self._threads) < self.size:
+                thread = threading.Thread(target = self._work)
+                thread.setDaemon(True)
+                self._threads.append(thread)
+                thread.start()
+            self._queue.put(task)
+        finally:
+            self._lock.release()
+        return task
+
+    def close(self):
+        """
+        Lets each thread exit once the calls already submitted
+        are done. Doesn't wait for them.
+        """
+        self._lock.acquire()
+        try:
+            threads = len(self._threads)
+        finally:
+            self._lock.release()
+        for i in range(threads):
+            self._queue.put(None)
+
+    def _work(self):
+        # Each thread is started for a task, and counts as idle
+        # only once it has finished one.
+        while 1:
+            task = self._queue.get()
+            if task is None:
+                self._lock.acquire()
+                self._threads.remove(threading.currentThread())
+                self._lock.release()
+                return
+            task.run()
+            self._set_idle(1)
+
+    def _set_idle(self, delta):
+        self._lock.acquire()
+        self._idle += delta
+        self._lock.release()
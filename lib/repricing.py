@@ -0,0 +1,152 @@
+"""
+Changing the amount of every recurring payment on a
+subscription level, after its price changes.
+"""
+import os
+import time
+from django.db import transaction
+from django.utils import simplejson
+from account.lib.payment.batch import ConcurrentGateway
+
+
+class Checkpoint(object):
+    """
+    Progress of a repricing run, kept in a JSON file that is
+    rewritten atomically after every batch. A run that is
+    restarted with the same file skips the payments that
+    are already done.
+    """
+    def __init__(self, path, level, amount):
+        self.path = path
+        self.level = level
+        self.amount = amount
+        self.done = set()
+        self.failed = {}
+        if os.path.exists(path):
+            data = simplejson.load(open(path))
+            if data['level'] != level or data['amount'] != amount:
+                raise ValueError(
+                    "%s is a checkpoint for level %s at %s, not level %s at %s" % (
+                        path, data['level'], data['amount'], level, amount
+                    )
+                )
+            self.done = set(data['done'])
+            self.failed = dict([(int(k), v) for k, v in data['failed'].items()])
+
+    def save(self):
+        temp = self.path + '.tmp'
+        out = open(temp, 'w')
+        try:
+            simplejson.dump({
+                'level': self.level,
+                'amount': self.amount,
+                'done': sorted(self.done),
+                'failed': self.failed,
+            }, out)
+            out.flush()
+            os.fsync(out.fileno())
+        finally:
+            out.close()
+        os.rename(temp, self.path)
+
+
+class RateLimiter(object):
+    """
+    Spaces calls to wait() at least 1 / rate seconds apart.
+    """
+    def __init__(self, rate):
+        self.interval = rate and 1.0 / rate or 0
+        self.next = 0
+
+    def wait(self):
+        now = time.time()
+        if self.next > now:
+            time.sleep(self.next - now)
+            now = self.next
+        self.next = now + self.interval
+
+
+def reprice(gateway, level, amount, checkpoint, concurrency=10, rate=5,
+            batch_size=50, timeout=120, progress=None):
+    """
+    Changes every active RecurringPayment of accounts on
+    subscription `level` to `amount` (in cents).
+
+    Payments are handled in batches of batch_size. Each batch's
+    gateway calls run on up to `concurrency` threads, started
+    no more than `rate` per second; the gateway's connection
+    pool is grown to `concurrency` if it is smaller. The new
+    amounts of the calls that succeeded are then saved in
+    one transaction, and the checkpoint is saved. A crash between a gateway
+    call and the commit only means that call is repeated when
+    the run is restarted, which is harmless: the amount is
+    the same. `progress`, if given, is called as
+    progress(done, failed) after each batch.
+
+    Returns (number changed, dict of payment id -> error).
+    """
+    from account.models import RecurringPayment
+    # RecurringPayment.save() reads the account, so fetch it
+    # with the payment rather than once per save.
+    payments = RecurringPayment.objects.filter(
+        account__subscription_level_id = level,
+        cancelled_at__isnull = True,
+    ).select_related().order_by('id')
+    new_amount = '$' + str(amount)
+    todo = [
+        p for p in payments
+        if p.id not in checkpoint.done and p.amount != new_amount
+    ]
+
+    # Keep a connection for every call in flight, or those over
+    # the pool size are closed after each call and reconnect.
+    pool = getattr(gateway, 'pool', None)
+    if pool is not None and pool.max_size < concurrency:
+        pool.max_size = concurrency
+    client = ConcurrentGateway(gateway, concurrency, timeout)
+    limiter = RateLimiter(rate)
+    changed = 0
+    try:
+        for start in range(0, len(todo), batch_size):
+            batch = todo[start:start + batch_size]
+            calls = []
+            for payment in batch:
+                limiter.wait()
+                calls.append((payment, client.change_payment(**payment.change_payment_args(amount))))
+
+            succeeded = []
+            for payment, call in calls:
+                try:
+                    call.result()
+                except Exception, e:
+                    checkpoint.failed[payment.id] = '%s: %s' % (e.__class__.__name__, e)
+                else:
+                    payment.amount = new_amount
+                    succeeded.append(payment)
+
+            _save_all(succeeded)
+            for payment in succeeded:
+                checkpoint.done.add(payment.id)
+                checkpoint.failed.pop(payment.id, None)
+            checkpoint.save()
+            changed += len(succeeded)
+            if progress:
+                progress(len(checkpoint.done), len(checkpoint.failed))
+    finally:
+        client.close()
+    return changed, checkpoint.failed
+
+
+def _save_all(payments):
+    transaction.enter_transaction_management()
+    transaction.managed(True)
+    try:
+        try:
+            for payment in payments:
+                payment.save()
+            transaction.commit()
+        except:
+            transaction.rollback()
+            raise
+    finally:
+        transaction.leave_transaction_management()
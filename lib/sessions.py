@@ -0,0 +1,331 @@
+"""
+Session storage backends for DualSessionMiddleware.
+
+Pick one with the DUAL_SESSION_STORE setting:
+
+    'db'            - django.contrib.sessions Session table (default)
+    'cache'         - django.core.cache only
+    'cache_db'      - reads from the cache, writes to cache and db
+    'signed_cookie' - the session data lives in a signed cookie
+
+or give the dotted path of your own SessionStore subclass.
+"""
+import base64
+import datetime
+import hmac
+import logging
+import md5
+import os
+import random
+import sys
+import time
+from hashlib import sha1
+from django.conf import settings
+from django.contrib.sessions.middleware import SessionWrapper
+from django.contrib.sessions.models import Session
+from django.db import connection, transaction
+from django.utils import simplejson
+from django.core.exceptions import ImproperlyConfigured, SuspiciousOperation
+
+
+class SessionStore(object):
+    """
+    Base class for session stores. A store loads and saves
+    session dicts. The value returned by save() is what
+    goes into the session cookie.
+    """
+    def load(self, cookie_value):
+        """
+        Returns (session dict, expire date) for a cookie value,
+        or None if there is no such session or it has expired.
+        """
+        raise NotImplementedError
+
+    def save(self, session_key, data, expire_date):
+        """
+        Stores the session dict. session_key is None for new
+        sessions. Returns the new cookie value.
+        """
+        raise NotImplementedError
+
+    def touch(self, session_key, data, expire_date):
+        """
+        Moves the expire date of an unmodified session.
+        Returns the cookie value. Stores that can change
+        the expiry without rewriting the data override this.
+        """
+        return self.save(session_key, data, expire_date)
+
+    def delete(self, session_key):
+        raise NotImplementedError
+
+    def new_key(self):
+        while 1:
+            session_key = md5.new("%s%s%s%s" % (
+                random.randint(0, sys.maxint - 1),
+                os.getpid(),
+                time.time(),
+                settings.SECRET_KEY,
+            )).hexdigest()
+            if not self.exists(session_key):
+                return session_key
+
+    def exists(self, session_key):
+        return self.load(session_key) is not None
+
+
+class DatabaseStore(SessionStore):
+    """
+    The stock django.contrib.sessions Session table.
+    """
+    def load(self, session_key):
+        try:
+            session = Session.objects.get(
+                session_key = session_key,
+                expire_date__gt = datetime.datetime.now(),
+            )
+            return session.get_decoded(), session.expire_date
+        except (Session.DoesNotExist, SuspiciousOperation):
+            return None
+
+    def save(self, session_key, data, expire_date):
+        session_key = session_key or Session.objects.get_new_session_key()
+        Session.objects.save(session_key, data, expire_date)
+        return session_key
+
+    def touch(self, session_key, data, expire_date):
+        cursor = connection.cursor()
+        cursor.execute(
+            'UPDATE %s SET expire_date = %%s WHERE session_key = %%s' % (
+                Session._meta.db_table,
+            ),
+            [expire_date, session_key],
+        )
+        transaction.commit_unless_managed()
+        return session_key
+
+    def delete(self, session_key):
+        Session.objects.filter(session_key = session_key).delete()
+
+
+class CacheStore(SessionStore):
+    """
+    Keeps sessions in django.core.cache only. Fast, but
+    sessions are lost if the cache is flushed or evicts
+    them, so use a cache that is shared by all workers.
+    """
+    prefix = 'account.session.'
+
+    def __init__(self):
+        from django.core.cache import cache
+        self.cache = cache
+
+    def load(self, session_key):
+        if not session_key.isalnum():
+            # Not one of our keys, and not safe as a cache key.
+            return None
+        return self.cache.get(self.prefix + session_key)
+
+    def save(self, session_key, data, expire_date):
+        session_key = session_key or self.new_key()
+        self.cache.set(
+            self.prefix + session_key,
+            (data, expire_date),
+            _seconds_until(expire_date),
+        )
+        return session_key
+
+    def delete(self, session_key):
+        self.cache.delete(self.prefix + session_key)
+
+
+class CachedDatabaseStore(CacheStore):
+    """
+    Write-through cache in front of the Session table.
+    Reads come from the cache; the table is only read
+    on a cache miss. Sessions survive a cache flush.
+    """
+    def __init__(self):
+        super(CachedDatabaseStore, self).__init__()
+        self.db = DatabaseStore()
+
+    def load(self, session_key):
+        loaded = super(CachedDatabaseStore, self).load(session_key)
+        if loaded is None:
+            loaded = self.db.load(session_key)
+            if loaded is None:
+                return None
+            super(CachedDatabaseStore, self).save(session_key, *loaded)
+        return loaded
+
+    def save(self, session_key, data, expire_date):
+        session_key = self.db.save(session_key, data, expire_date)
+        return super(CachedDatabaseStore, self).save(session_key, data, expire_date)
+
+    def touch(self, session_key, data, expire_date):
+        self.db.touch(session_key, data, expire_date)
+        return super(CachedDatabaseStore, self).save(session_key, data, expire_date)
+
+    def delete(self, session_key):
+        self.db.delete(session_key)
+        super(CachedDatabaseStore, self).delete(session_key)
+
+
+class SignedCookieStore(SessionStore):
+    """
+    Stores the whole session in the cookie as JSON, signed 
+    with a key derived from SECRET_KEY so it can't be 
+    tampered with. It is NOT encrypted: don't put secrets in
+    the session. Only JSON types survive (tuples come back
+    as lists). Browsers drop cookies over 4k, so keep 
+    sessions small.
+    """
+    max_cookie_size = 4000
+    salt = 'account.lib.sessions.SignedCookieStore'
+
+    def load(self, cookie_value):
+        try:
+            payload, signature = str(cookie_value).split(':', 1)
+        except (ValueError, UnicodeEncodeError):
+            return None
+        if not _constant_time_equals(signature, self._sign(payload)):
+            return None
+        try:
+            expires, data = simplejson.loads(base64.urlsafe_b64decode(payload))
+        except Exception:
+            return None
+        if not isinstance(data, dict):
+            return None
+        if expires < time.time():
+            return None
+        return data, datetime.datetime.fromtimestamp(expires)
+
+    def save(self, session_key, data, expire_date):
+        payload = base64.urlsafe_b64encode(simplejson.dumps(
+            (time.mktime(expire_date.timetuple()), data),
+        ))
+        value = '%s:%s' % (payload, self._sign(payload))
+        if len(value) > self.max_cookie_size:
+            logging.warning(
+                'Signed session cookie is %i bytes; browsers may drop it.' % len(value)
+            )
+        return value
+
+    def delete(self, session_key):
+        # Nothing is stored server side.
+        pass
+
+    def new_key(self):
+        return None
+
+    def _sign(self, payload):
+        # Don't sign with SECRET_KEY itself, so these MACs 
+        # can't be reused anywhere else that it is used.
+        key = sha1(self.salt + settings.SECRET_KEY).digest()
+        return hmac.new(key, payload, sha1).hexdigest()
+
+
+STORES = {
+    'db': DatabaseStore,
+    'cache': CacheStore,
+    'cache_db': CachedDatabaseStore,
+    'signed_cookie': SignedCookieStore,
+}
+
+def get_store(name=None):
+    """
+    Returns a store instance for a name in STORES or a
+    dotted path to a SessionStore subclass. Defaults to
+    settings.DUAL_SESSION_STORE.
+    """
+    name = name or getattr(settings, 'DUAL_SESSION_STORE', 'db')
+    if name in STORES:
+        return STORES[name]()
+    try:
+        module, attr = name.rsplit('.', 1)
+        return getattr(__import__(module, {}, {}, [attr]), attr)()
+    except (ValueError, ImportError, AttributeError), e:
+        raise ImproperlyConfigured(
+            'Unknown DUAL_SESSION_STORE %r: %s' % (name, e)
+        )
+
+
+class StoreSessionWrapper(SessionWrapper):
+    """
+    SessionWrapper that loads the session from a
+    SessionStore instead of the Session table. Once
+    loaded, expire_date holds the stored expiry (None
+    for new sessions).
+    """
+    def __init__(self, session_key, store):
+        SessionWrapper.__init__(self, session_key)
+        self.store = store
+        self.expire_date = None
+
+    def _get_session(self):
+        self.accessed = True
+        try:
+            return self._session_cache
+        except AttributeError:
+            loaded = None
+            if self.session_key is not None:
+                loaded = self.store.load(self.session_key)
+            if loaded is None:
+                # Force a new key for an unknown session.
+                self.session_key = None
+                loaded = {}, None
+            self._session_cache, self.expire_date = loaded
+            return self._session_cache
+
+    _session = property(_get_session)
+
+
+def sweep_expired(batch_size=500, pause=0.1, progress=None):
+    """
+    Deletes expired rows from the Session table, walking the
+    primary key in chunks of batch_size keys and sleeping
+    `pause` seconds between chunks. Each chunk selects the 
+    next batch_size rows by key range, expired or not, and
+    deletes the expired ones among them by key, so no
+    statement holds locks for long or scans the rest of the
+    table. `progress`, if given, is called as 
+    progress(deleted_so_far) after each chunk. Returns the
+    number of sessions deleted.
+
+    Only the 'db' and 'cache_db' stores need this; cached and
+    signed cookie sessions expire on their own.
+    """
+    now = datetime.datetime.now()
+    deleted = 0
+    last_key = ''
+    while 1:
+        rows = list(Session.objects.filter(
+            session_key__gt = last_key,
+        ).order_by('session_key').values('session_key', 'expire_date')[:batch_size])
+        if not rows:
+            break
+        expired = [row['session_key'] for row in rows if row['expire_date'] < now]
+        if expired:
+            Session.objects.filter(session_key__in = expired).delete()
+            transaction.commit_unless_managed()
+            deleted += len(expired)
+        last_key = rows[-1]['session_key']
+        if progress:
+            progress(deleted)
+        if len(rows) < batch_size:
+            break
+        time.sleep(pause)
+    return deleted
+
+
+def _seconds_until(when):
+    delta = when - datetime.datetime.now()
+    return max(delta.days * 86400 + delta.seconds, 1)
+
+def _constant_time_equals(a, b):
+    if len(a) != len(b):
+        return False
+    result = 0
+    for x, y in zip(a, b):
+        result |= ord(x) ^ ord(y)
+    return result == 0
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import NoArgsCommand, CommandError
+from account.models import Plan
+
+
+class Command(NoArgsCommand):
+    help = "Copies settings.SUBSCRIPTION_LEVELS into the Plan tables."
+    
+    def handle_noargs(self, **options):
+        try:
+            loaded = Plan.load_levels(settings.SUBSCRIPTION_LEVELS)
+        except ImproperlyConfigured, e:
+            raise CommandError(str(e))
+        if int(options.get('verbosity', 1)) > 0:
+            print "Loaded %i plans." % loaded
@@ -0,0 +1,11 @@
+from django.core.management.base import NoArgsCommand
+from account.models import ResourceCount
+
+
+class Command(NoArgsCommand):
+    help = "Recounts the per-account resource counters used by subscription.count regulators."
+    
+    def handle_noargs(self, **options):
+        fixed = ResourceCount.reconcile()
+        if int(options.get('verbosity', 1)) > 0:
+            print "Fixed %i resource counters." % fixed
@@ -0,0 +1,71 @@
+from optparse import make_option
+from django.conf import settings
+from django.core.management.base import NoArgsCommand, CommandError
+from account import subscription
+from account.models import recurring_payment
+from account.lib.repricing import Checkpoint, reprice
+
+
+class Command(NoArgsCommand):
+    help = "Changes the recurring payments of every account on a subscription level to its price."
+    
+    option_list = NoArgsCommand.option_list + (
+        make_option('--level', dest = 'level', type = 'int',
+            help = 'subscription_level_id of the accounts to reprice.'),
+        make_option('--amount', dest = 'amount', type = 'int', default = None,
+            help = "New amount in cents. Defaults to the level's price."),
+        make_option('--checkpoint', dest = 'checkpoint', default = None,
+            help = 'Progress file, for restarting. Defaults to reprice-LEVEL-AMOUNT.json'),
+        make_option('--concurrency', dest = 'concurrency', type = 'int', default = 10,
+            help = 'Gateway calls in flight at once.'),
+        make_option('--rate', dest = 'rate', type = 'float', default = 5,
+            help = 'Gateway calls started per second.'),
+        make_option('--batch-size', dest = 'batch_size', type = 'int', default = 50,
+            help = 'Payments saved per transaction.'),
+        make_option('--timeout', dest = 'timeout', type = 'float', default = 120,
+            help = 'Seconds each gateway call may take once started. Time queued is not counted.'),
+    )
+    
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        level = options['level']
+        if level is None:
+            raise CommandError('--level is required.')
+        try:
+            subscription_level = subscription.catalog()[level]
+        except IndexError:
+            raise CommandError('There is no subscription level %i.' % level)
+        amount = options['amount']
+        if amount is None:
+            amount = subscription_level.price
+        
+        path = options['checkpoint'] or 'reprice-%i-%i.json' % (level, amount)
+        try:
+            checkpoint = Checkpoint(path, level, amount)
+        except ValueError, e:
+            raise CommandError(str(e))
+        
+        def progress(done, failed):
+            if verbosity > 1:
+                print "%i changed, %i failed so far..." % (done, failed)
+        
+        changed, failed = reprice(
+            _gateway(), level, amount, checkpoint,
+            concurrency = options['concurrency'],
+            rate = options['rate'],
+            batch_size = options['batch_size'],
+            timeout = options['timeout'],
+            progress = progress,
+        )
+        if verbosity > 0:
+            print "Changed %i payments to %s. Progress is in %s." % (changed, amount, path)
+            for payment_id, error in sorted(failed.items()):
+                print "Payment %i failed: %s" % (payment_id, error)
+    
+    
+def _gateway():
+    gateway = getattr(recurring_payment, 'gateway', None)
+    if gateway is None:
+        name = 'account.lib.payment.' + settings.PAYMENT_GATEWAY
+        gateway = __import__(name, {}, {}, [settings.PAYMENT_GATEWAY])
+    return gateway
@@ -0,0 +1,11 @@
+from django.core.management.base import NoArgsCommand
+from account.models import UsageEvent
+
+
+class Command(NoArgsCommand):
+    help = "Adds new usage ledger events to the monthly totals read by subscription.metered regulators."
+    
+    def handle_noargs(self, **options):
+        changed = UsageEvent.rollup()
+        if int(options.get('verbosity', 1)) > 0:
+            print "Updated %i usage totals." % changed
@@ -0,0 +1,43 @@
+import time
+from optparse import make_option
+from django.core.management.base import NoArgsCommand, CommandError
+from account import subscription
+from account.lib.disk_usage import scan_accounts
+
+
+class Command(NoArgsCommand):
+    help = "Measures account directories for subscription.disk() regulators."
+    
+    option_list = NoArgsCommand.option_list + (
+        make_option('--limit', dest = 'limit', type = 'int', default = None,
+            help = 'Number of accounts to scan, least recently scanned first.'),
+        make_option('--pause', dest = 'pause', type = 'float', default = 0.1,
+            help = 'Seconds to sleep between accounts.'),
+        make_option('--every', dest = 'every', type = 'int', default = None,
+            help = 'Keep running, starting a new pass every this many seconds.'),
+    )
+    
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        regulators = subscription.disk_regulators()
+        if not regulators:
+            raise CommandError('No subscription.disk() regulator in SUBSCRIPTION_REGULATORS.')
+        
+        def progress(account, kilobytes):
+            if verbosity > 1:
+                print "%s: %i KB" % (account, kilobytes)
+        
+        while 1:
+            started = time.time()
+            for regulator in regulators:
+                scanned = scan_accounts(
+                    regulator, 
+                    limit = options['limit'],
+                    pause = options['pause'],
+                    progress = progress,
+                )
+                if verbosity > 0:
+                    print "Scanned %i accounts." % scanned
+            if not options['every']:
+                break
+            time.sleep(max(options['every'] - (time.time() - started), 0))
@@ -0,0 +1,35 @@
+import time
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from account.models import Account, UsageSnapshot
+
+
+class Command(NoArgsCommand):
+    help = "Refreshes the resource usage snapshots shown on account pages."
+    
+    option_list = NoArgsCommand.option_list + (
+        make_option('--stale', dest = 'stale', action = 'store_true', default = False,
+            help = 'Only refresh snapshots older than SUBSCRIPTION_SNAPSHOT_MAX_AGE.'),
+        make_option('--pause', dest = 'pause', type = 'float', default = 0.1,
+            help = 'Seconds to sleep between accounts.'),
+    )
+    
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        fresh = set()
+        if options['stale']:
+            fresh = set([
+                snapshot.account_id for snapshot in UsageSnapshot.objects.all()
+                if not snapshot.is_stale()
+            ])
+        refreshed = 0
+        for account in Account.objects.order_by('id'):
+            if account.id in fresh:
+                continue
+            UsageSnapshot.refresh(account)
+            refreshed += 1
+            if verbosity > 1:
+                print "Refreshed %s." % account
+            time.sleep(options['pause'])
+        if verbosity > 0:
+            print "Refreshed %i usage snapshots." % refreshed
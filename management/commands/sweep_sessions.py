@@ -0,0 +1,29 @@
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from account.lib.sessions import sweep_expired
+
+
+class Command(NoArgsCommand):
+    help = "Deletes expired sessions in small batches."
+    
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', dest = 'batch_size', type = 'int', default = 500,
+            help = 'Number of sessions deleted per batch.'),
+        make_option('--pause', dest = 'pause', type = 'float', default = 0.1,
+            help = 'Seconds to sleep between batches.'),
+    )
+    
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        
+        def progress(deleted):
+            if verbosity > 1:
+                print "Deleted %i expired sessions so far..." % deleted
+                
+        deleted = sweep_expired(
+            batch_size = options['batch_size'],
+            pause = options['pause'],
+            progress = progress,
+        )
+        if verbosity > 0:
+            print "Deleted %i expired sessions." % deleted
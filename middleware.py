@@ -1,11 +1,13 @@
 from django.http import HttpResponse, Http404, HttpResponseForbidden, HttpResponsePermanentRedirect, get_host, HttpResponseRedirect
 from models import Account, Person
+from policy import AccessPolicy
+from account import subscription
 from django.core.exceptions import ObjectDoesNotExist
 import views.authentication
 import views.subscription
 from django.conf import settings
 from django.contrib.sessions.models import Session
-from django.contrib.sessions.middleware import SessionWrapper
+from lib import sessions
 from django.utils.cache import patch_vary_headers
 import datetime        
 import helpers
@@ -25,20 +27,60 @@ def add_account_to_context(request):
     return data
     
     
+class LazyAccount(object):
+    """
+    Loads request.account the first time it is accessed.
+    The result is stored on the request instance, which
+    hides this descriptor for the rest of the request.
+    
+    If someone is logged in, the person is loaded along 
+    with the account in a single query.
+    """
+    def __get__(self, request, obj_type=None):
+        if request is None:
+            return self
+        request.account = None
+        if 'person' not in request.__dict__ and Person.load_with_account(request):
+            return request.account
+        return Account.load_from_request(request)
+    
+    
+class LazyPerson(object):
+    """
+    Loads request.person the first time it is accessed.
+    """
+    def __get__(self, request, obj_type=None):
+        if request is None:
+            return self
+        if 'account' not in request.__dict__:
+            return Person.load_with_account(request)
+        request.person = None
+        return Person.load_from_request(request)
+    
+    
 class AccountBasedAuthentication(object):
     """
     Loads current account and person into request.
     Allows or denies access to urls based on login
     state and person roles.
+    
+    Both are loaded lazily, so views that never look at
+    request.person don't pay for the lookup.
     """
+    def __init__(self):
+        # Check SUBSCRIPTION_LEVELS when the server starts,
+        # rather than in the middle of a request.
+        subscription.catalog()
+        
     def process_request(self, request):
-        Account.load_from_request(request)
-        Person.load_from_request(request)
+        request.__class__.account = LazyAccount()
+        request.__class__.person = LazyPerson()
     
     def process_view(self, request, view_func, view_args, view_kwargs):
         """
         This function uses the contents of view_kwargs['meta'] 
-        determine access rights.
+        determine access rights. meta is an AccessPolicy, or
+        a dict with the same keys, which is compiled into one.
         
         The rules are:
         
@@ -55,11 +97,11 @@ class AccountBasedAuthentication(object):
             show view only if account has 'widget' resources.
             Redirects to upgrade screen if not.
             
-        meta['roles'] == 'role1 & (role2 | role 3)':
+        meta['roles'] == 'role1 & (role2 | role3)':
             Show view if person is logged in &
             has role1 and either role2 or role3
         
-        meta['roles'] == None or '' or <not set>
+        meta['roles'] == None or <not set>
             Show view without checking roles.
         """
         
@@ -67,19 +109,20 @@ class AccountBasedAuthentication(object):
         if 'meta' not in view_kwargs:
             return None
         
-        meta = view_kwargs.pop('meta')
+        policy = AccessPolicy.from_meta(view_kwargs.pop('meta'))
+        policy.check_roles()
         
         # SSL 
-        if meta.get('ssl') and not request.is_secure():
+        if policy.ssl and not request.is_secure():
             if request.method == 'GET':
                 return self._redirect(request, True)
             else:
                 return HttpResponseForbidden()
         
         # Requires account
-        account = getattr(request, 'account', None)
+        account = request.account
         
-        if meta.get('requires_account', True):
+        if policy.requires_account:
             if not account:
                 raise Http404
         else:
@@ -90,26 +133,26 @@ class AccountBasedAuthentication(object):
             
         # Requires account to be active
         if not account.active:
-            if not meta.get('inactive_account_ok'):
+            if not policy.inactive_account_ok:
                 return HttpResponseRedirect('/account/inactive/')
             
         
         # Requires login
-        if 'roles' in meta:
-            meta['requires_login'] = True
-            
-        person = getattr(request, 'person', None)
+        if policy.requires_login or policy.requires_logout:
+            person = request.person
+        else:
+            person = None
         
-        if meta.get('requires_logout') and person:
+        if policy.requires_logout and person:
             return HttpResponseForbidden()
         
-        if meta.get('requires_login') and not person:
+        if policy.requires_login and not person:
             return helpers.redirect(
                 views.authentication.login
             )
         
         # Requires reource
-        if not account.has_resource(meta.get('requires_resource')):
+        if not account.has_resource(policy.requires_resource):
             return helpers.redirect(
                 views.subscription.upgrade
             )
@@ -118,7 +161,7 @@ class AccountBasedAuthentication(object):
             return None
                 
         # Requires role
-        if person.has_roles(meta.get('roles')):
+        if person.has_roles(policy.roles):
             return None
         else:
             return HttpResponseForbidden()
@@ -165,11 +208,21 @@ class DualSessionMiddleware(object):
     
     session[settings.PERSISTENT_SESSION_KEY] = False
     
+    Sessions are kept in the Session table unless the 
+    DUAL_SESSION_STORE setting picks a faster store; see
+    account.lib.sessions.
+    
     CREDIT: http://code.djangoproject.com/wiki/CookBookDualSessionMiddleware
     """
     
+    def __init__(self):
+        self.store = sessions.get_store()
+    
     def process_request(self, request):
-        request.session = SessionWrapper(request.COOKIES.get(settings.SESSION_COOKIE_NAME, None))
+        request.session = sessions.StoreSessionWrapper(
+            request.COOKIES.get(settings.SESSION_COOKIE_NAME, None),
+            self.store,
+        )
 
     def process_response(self, request, response):
         # If request.session was modified, or if response.session was set, save
@@ -180,8 +233,7 @@ class DualSessionMiddleware(object):
         except AttributeError:
             pass
         else:
-            if modified or settings.SESSION_SAVE_EVERY_REQUEST:
-                session_key = request.session.session_key or Session.objects.get_new_session_key()
+            if modified or self._needs_refresh(request.session):
                 if not request.session.get(settings.PERSISTENT_SESSION_KEY, False):
                     # session will expire when the user closes the browser
                     max_age = None
@@ -191,19 +243,37 @@ class DualSessionMiddleware(object):
                     max_age = settings.SESSION_COOKIE_AGE
                     expires = datetime.datetime.strftime(datetime.datetime.utcnow() + datetime.timedelta(seconds=settings.SESSION_COOKIE_AGE), "%a, %d-%b-%Y %H:%M:%S GMT")
                 
-                new_session = Session.objects.save(session_key, 
-                                                   request.session._session,
-                                                   datetime.datetime.now() + datetime.timedelta(seconds=settings.SESSION_COOKIE_AGE))
+                if modified or not request.session.session_key:
+                    write = self.store.save
+                else:
+                    # Only the expiry changes.
+                    write = self.store.touch
+                session_key = write(request.session.session_key, 
+                                    request.session._session,
+                                    datetime.datetime.now() + datetime.timedelta(seconds=settings.SESSION_COOKIE_AGE))
                 response.set_cookie(settings.SESSION_COOKIE_NAME, session_key,
                                     max_age = max_age, expires = expires, 
                                     domain = settings.SESSION_COOKIE_DOMAIN,
                                     secure = settings.SESSION_COOKIE_SECURE or None)
-        return response        
-        
-        
-        
-        
-        
-        
-        
-        
\ No newline at end of file
+        return response
+    
+    def _needs_refresh(self, session):
+        """
+        With SESSION_SAVE_EVERY_REQUEST on, unmodified sessions 
+        are written to slide their expiry. If the setting 
+        DUAL_SESSION_REFRESH_FRACTION is set (e.g. 0.1), that only 
+        happens once the session has used up that fraction of 
+        SESSION_COOKIE_AGE since it was last written.
+        """
+        if not settings.SESSION_SAVE_EVERY_REQUEST:
+            return False
+        fraction = getattr(settings, 'DUAL_SESSION_REFRESH_FRACTION', None)
+        if fraction is None:
+            return True
+        session._session # loads session.expire_date
+        if session.expire_date is None:
+            # A new, empty session. Nothing to slide.
+            return False
+        remaining = session.expire_date - datetime.datetime.now()
+        used = settings.SESSION_COOKIE_AGE - (remaining.days * 86400 + remaining.seconds)
+        return used >= fraction * settings.SESSION_COOKIE_AGE
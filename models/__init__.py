@@ -3,3 +3,8 @@ from person import Person
 from group import Group
 from role import Role
 from recurring_payment import RecurringPayment
+from resource_count import ResourceCount
+from disk_usage import DiskUsage
+from plan import Plan, PlanResource, PlanVersion
+from usage import UsageEvent, UsageTotal, UsageRollup
+from usage_snapshot import UsageSnapshot
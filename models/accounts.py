@@ -1,7 +1,39 @@
+import copy
+import itertools
 from django.db import models
+from django.db.models import signals
+from django.dispatch import dispatcher
 from django.contrib.auth.models import User
 from django.conf import settings
 from account import subscription
+from account.lib.cache import LRUCache
+
+# Process-local cache of HTTP_HOST -> Account. Unknown hosts
+# are cached as None, for a shorter time.
+host_cache = LRUCache(
+    max_size = getattr(settings, 'ACCOUNT_HOST_CACHE_SIZE', 1000),
+    ttl = getattr(settings, 'ACCOUNT_HOST_CACHE_TTL', 300),
+)
+HOST_CACHE_NEGATIVE_TTL = getattr(settings, 'ACCOUNT_HOST_CACHE_NEGATIVE_TTL', 30)
+_not_cached = object()
+
+# account id -> stamp of the last change to something a
+# regulator counts. Memoized resource checks older than
+# the stamp are thrown away. Only recently changed accounts
+# are kept; since an evicted stamp can't be told from "never
+# changed", every eviction also throws the memos away.
+_resource_changes = LRUCache(
+    max_size = getattr(settings, 'ACCOUNT_RESOURCE_CHANGES_SIZE', 10000),
+)
+_change_stamps = itertools.count(1)
+
+def resources_changed(account_id):
+    """
+    Drops the memoized has_resource() answers of every 
+    Account instance for account_id. Called when a counted 
+    object is created or deleted.
+    """
+    _resource_changes.set(account_id, _change_stamps.next())
 
 class Account(models.Model):
     
@@ -82,36 +114,98 @@ class Account(models.Model):
         
     @property
     def subscription_level(self):
-        return settings.SUBSCRIPTION_LEVELS[self.subscription_level_id]
+        return subscription.catalog()[self.subscription_level_id]
     
     def _find_level(self, handle):
-        for i, level in enumerate(settings.SUBSCRIPTION_LEVELS):
-            if level['handle'] == handle:
-                return i, level
+        level = subscription.catalog().find(handle)
+        return level.index, level
         
     def requires_payment(self):
-        return self.subscription_level['price'] > 0
+        return self.subscription_level.price > 0
             
     def has_level_or_greater(self, handle):
-        i, level = self._find_level(handle)
-        return self.subscription_level_id >= i
+        return self.subscription_level_id >= subscription.catalog().index(handle)
             
     def has_level(self, handle):
-        i, level = self._find_level(handle)
-        return self.subscription_level_id == i
+        return self.subscription_level_id == subscription.catalog().index(handle)
             
             
         
     def has_resource(self, resource_name):
+        """
+        Answers are memoized on this instance, which lives for
+        one request (see from_host), so the middleware and any 
+        number of {% ifresource %} tags run each regulator once.
+        """
         if not resource_name:
             return True
-        resource = self.subscription_level['resources'][resource_name]
-        if resource is subscription.Unlimited:
-            return True
-        return settings.SUBSCRIPTION_REGULATORS.get(resource_name, lambda a, v: v)(
-            self,
-            resource
+        memo = self._resource_memo()
+        try:
+            return memo[resource_name]
+        except KeyError:
+            result = memo[resource_name] = self.subscription_level.has_resource(self, resource_name)
+            return result
+    
+    def reserve_resource(self, resource_name):
+        """
+        Takes one unit of a resource before creating the 
+        object that uses it. Returns None if the limit is 
+        reached, else a Reservation to claim() with the new 
+        object:
+        
+        reservation = account.reserve_resource('people')
+        if reservation is None:
+            ...
+        reservation.claim(person)
+        try:
+            person.save()
+        except:
+            reservation.release()
+            raise
+        """
+        return self.subscription_level.reserve(self, resource_name)
+    
+    def resource_usage(self, refresh=False):
+        """
+        Returns a subscription.ResourceUsage snapshot of every 
+        resource in the account's subscription level, measured 
+        with as few queries as possible. The snapshot is kept 
+        on this instance for reuse during the request; pass 
+        refresh = True to measure again.
+        """
+        memo = self._resource_memo()
+        if refresh or '__usage__' not in memo:
+            memo['__usage__'] = self.subscription_level.measure(self)
+        return memo['__usage__']
+    
+    def check_resources(self, resource_names):
+        """
+        Returns a dict of resource name -> has_resource(name),
+        evaluating the ones not already memoized in one batch.
+        """
+        memo = self._resource_memo()
+        missing = [name for name in resource_names if name and name not in memo]
+        if missing:
+            usage = self.subscription_level.measure(self, missing)
+            for name in missing:
+                memo[name] = usage.allows(name)
+        return dict([(name, not name or memo[name]) for name in resource_names])
+    
+    def _resource_memo(self):
+        """
+        Returns the dict of memoized resource answers, emptied
+        if the level changed or resources_changed() was called 
+        for this account since it was filled.
+        """
+        stamp = (
+            self.subscription_level_id, 
+            _resource_changes.get(self.id), 
+            _resource_changes.evictions,
         )
+        cached = getattr(self, '_resource_memo_cache', None)
+        if cached is None or cached[0] != stamp:
+            cached = self._resource_memo_cache = (stamp, {})
+        return cached[1]
 
     
     def __unicode__(self):
@@ -119,15 +213,53 @@ class Account(models.Model):
 
     @classmethod
     def load_from_request(cls, request):
-        try:
-            pieces = request.META['HTTP_HOST'].split('.')
-            request.account = Account.objects.get(
-                subdomain = pieces[0],
-                domain = '.'.join(pieces[1:]),
-            )
-        except (models.ObjectDoesNotExist, KeyError):
-            request.account = None
-        
+        request.account = cls.from_host(request.META.get('HTTP_HOST'))
         return request.account
+    
+    @classmethod
+    def from_host(cls, host):
+        """
+        Returns the account for a host like 'sub.domain.com',
+        or None. Results, including unknown hosts, are kept 
+        in host_cache. Each caller gets its own copy.
+        """
+        if not host:
+            return None
+        account = host_cache.get(host, _not_cached)
+        if account is _not_cached:
+            subdomain, domain = cls.split_host(host)
+            try:
+                account = Account.objects.get(
+                    subdomain = subdomain,
+                    domain = domain,
+                )
+                host_cache.set(host, account)
+            except models.ObjectDoesNotExist:
+                account = None
+                host_cache.set(host, None, HOST_CACHE_NEGATIVE_TTL)
+        if account is None:
+            return None
+        return copy.copy(account)
+    
+    @staticmethod
+    def split_host(host):
+        """
+        'sub.domain.com' -> ('sub', 'domain.com')
+        """
+        pieces = host.split('.')
+        return pieces[0], '.'.join(pieces[1:])
         
         
+def _invalidate_host_cache(instance, **kwargs):
+    """
+    Drops cached lookups for the account's current host
+    (which may be negatively cached) and for any host
+    that used to point at it.
+    """
+    host_cache.delete(instance.full_domain)
+    host_cache.delete_where(
+        lambda host, account: account is not None and account.pk == instance.pk
+    )
+
+dispatcher.connect(_invalidate_host_cache, signal = signals.post_save, sender = Account)
+dispatcher.connect(_invalidate_host_cache, signal = signals.post_delete, sender = Account)
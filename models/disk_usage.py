@@ -0,0 +1,150 @@
+import datetime
+import os
+from django.conf import settings
+from django.db import models, connection, transaction, IntegrityError
+from accounts import Account, resources_changed
+from resource_count import _savepoint, _savepoint_rollback
+from account import subscription
+from account.lib.disk_usage import kilobytes, tree_kilobytes
+from account.lib.pool import WorkerPool
+
+
+class DiskUsage(models.Model):
+    """
+    Size of a directory of an account, for the subscription.disk()
+    regulator. There is one row per account and directory, so
+    several disk() regulators don't overwrite each other.
+    Measured by the scan_disk_usage command and adjusted in
+    between by add_file() / remove_file(), so requests read
+    one row instead of walking the directory.
+    """
+    class Admin:
+        pass
+
+    class Meta:
+        app_label = 'account'
+        unique_together = (('account', 'directory'),)
+
+    account = models.ForeignKey(
+        to = Account,
+        related_name = 'disk_usage_set',
+    )
+
+    directory = models.CharField(
+        max_length = 255,
+    )
+
+    # Each file rounded up to a whole kilobyte.
+    kilobytes = models.IntegerField(
+        default = 0,
+    )
+
+    scanned = models.DateTimeField(
+        null = True,
+        blank = True,
+    )
+
+    def __unicode__(self):
+        return u'%s: %i KB' % (self.directory, self.kilobytes)
+
+    @classmethod
+    def current(cls, account, path):
+        """
+        Returns the kilobytes used by account under path. A
+        directory that has never been measured counts as 0
+        until a scan queued in the background has stored it.
+        """
+        try:
+            return cls.objects.get(account = account, directory = path).kilobytes
+        except cls.DoesNotExist:
+            _scan_later(account, path)
+            return 0
+
+    @classmethod
+    def scan(cls, account, path):
+        """
+        Measures path and stores the result for account.
+        Returns the kilobytes used.
+        """
+        total = tree_kilobytes(path)
+        try:
+            usage = cls.objects.get(account = account, directory = path)
+        except cls.DoesNotExist:
+            usage = cls(account = account, directory = path)
+        usage.kilobytes = total
+        usage.scanned = datetime.datetime.now()
+        savepoint = _savepoint()
+        try:
+            usage.save()
+        except IntegrityError:
+            # Another process created the row first.
+            _savepoint_rollback(savepoint)
+        transaction.commit_unless_managed()
+        resources_changed(account.id)
+        return total
+
+    @classmethod
+    def adjust(cls, account_id, path, delta):
+        """
+        Atomically adds delta kilobytes to the totals of the
+        account's measured directories that contain path.
+        Directories that were never scanned are left alone.
+        """
+        ids = [
+            usage.id for usage in cls.objects.filter(account__id = account_id)
+            if _contains(usage.directory, path)
+        ]
+        if ids:
+            cursor = connection.cursor()
+            cursor.execute(
+                'UPDATE %s SET kilobytes = kilobytes + %%s WHERE id IN (%s)' % (
+                    cls._meta.db_table, ', '.join(['%s'] * len(ids)),
+                ),
+                [delta] + ids,
+            )
+            transaction.commit_unless_managed()
+        resources_changed(account_id)
+
+    @classmethod
+    def add_file(cls, account_id, path):
+        """
+        Call after writing an uploaded file.
+        """
+        cls.adjust(account_id, path, kilobytes(os.path.getsize(path)))
+
+    @classmethod
+    def remove_file(cls, account_id, path):
+        """
+        Call before deleting a file.
+        """
+        cls.adjust(account_id, path, -kilobytes(os.path.getsize(path)))
+
+
+def _contains(directory, path):
+    directory = os.path.join(os.path.abspath(directory), '')
+    return os.path.abspath(path).startswith(directory)
+
+
+_scanning = set()
+
+# Scans get threads of their own, so a slow one can't hold up
+# the bounded() regulators on subscription._regulator_pool().
+_scan_pool = WorkerPool(getattr(settings, 'SUBSCRIPTION_DISK_SCAN_THREADS', 1))
+
+def _scan_later(account, path):
+    if (account.id, path) in _scanning:
+        return
+    _scanning.add((account.id, path))
+    _scan_pool.submit(_scan, account.id, path)
+
+def _scan(account_id, path):
+    try:
+        subscription._run_regulator(_scan_account, account_id, path)
+    finally:
+        _scanning.discard((account_id, path))
+
+def _scan_account(account_id, path):
+    try:
+        DiskUsage.scan(Account.objects.get(pk = account_id), path)
+    except Account.DoesNotExist:
+        pass
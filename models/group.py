@@ -4,8 +4,8 @@ from django.utils.encoding import smart_str
 import sha
 import random
 from accounts import Account
-from role import Role
-from parser import SimpleRoleParser
+from role import Role, bits_by_name, mask_of
+from parser import compile_roles
 
 
 class Group(models.Model):
@@ -45,8 +45,11 @@ class Group(models.Model):
         """
         if not roles_string:
             return True
-        p=SimpleRoleParser(roles_string)
-        r=[role.name for role in self.role_set.all()]
-        return p.has_roles(r)        
+        expression = compile_roles(roles_string)
+        bits = bits_by_name(expression.names)
+        return expression.matches_mask(
+            mask_of([role['name'] for role in self.role_set.values('name')], bits),
+            bits,
+        )
         
         
@@ -1,56 +1,253 @@
-from operator import itemgetter
+import re
+
+
+class RoleSyntaxError(ValueError):
+    """
+    Raised when a role expression can't be parsed.
+    """
+    pass
+
+
+_token_re = re.compile(r'\s*(?:(\w+)|(.))')
+
+def _tokenize(expression):
+    """
+    Splits a role expression into role names and
+    the operators | & ( )
+    """
+    tokens = []
+    for name, op in _token_re.findall(expression):
+        if name:
+            tokens.append(('name', name))
+        elif op in '|&()':
+            tokens.append((op, op))
+        elif not op.isspace():
+            raise RoleSyntaxError(
+                "Unexpected character %r in role expression %r" % (op, expression)
+            )
+    return tokens
+
+
+class _Parser(object):
+    """
+    Recursive descent parser for role expressions.
+    '&' binds tighter than '|', as it did when these
+    expressions were passed to eval().
+
+        expression := term ('|' term)*
+        term       := factor ('&' factor)*
+        factor     := name | '(' expression ')'
+
+    Builds a tree of nested tuples:
+        ('name', 'admin')
+        ('|', [subtree, subtree, ...])
+        ('&', [subtree, subtree, ...])
+    """
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = _tokenize(expression)
+        self.pos = 0
+
+    def parse(self):
+        tree = self.expression_()
+        if self.pos != len(self.tokens):
+            self.error()
+        return tree
+
+    def error(self):
+        raise RoleSyntaxError(
+            "Invalid role expression %r" % self.expression
+        )
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos][0]
+
+    def take(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def expression_(self):
+        return self._joined('|', self.term)
+
+    def term(self):
+        return self._joined('&', self.factor)
+
+    def _joined(self, op, operand):
+        items = [operand()]
+        while self.peek() == op:
+            self.take()
+            items.append(operand())
+        if len(items) == 1:
+            return items[0]
+        return (op, items)
+
+    def factor(self):
+        kind = self.peek()
+        if kind == 'name':
+            return self.take()
+        if kind == '(':
+            self.take()
+            tree = self.expression_()
+            if self.peek() != ')':
+                self.error()
+            self.take()
+            return tree
+        self.error()
+
+
+def _build(tree):
+    """
+    Turns a parse tree into a function that takes a
+    set of role names and returns True or False.
+    """
+    kind, value = tree
+    if kind == 'name':
+        return lambda roles: value in roles
+
+    parts = [_build(t) for t in value]
+    if kind == '&':
+        return lambda roles: all(p(roles) for p in parts)
+    return lambda roles: any(p(roles) for p in parts)
+
+
+def _names(tree):
+    kind, value = tree
+    if kind == 'name':
+        return set([value])
+    names = set()
+    for t in value:
+        names |= _names(t)
+    return names
+
+
+def _build_mask(tree, bits):
+    """
+    Like _build, but the returned function tests an integer
+    role mask. `bits` maps role names to their bits. Names
+    joined by the same operator are folded into a single
+    bitwise test.
+    """
+    kind, value = tree
+    if kind == 'name':
+        bit = bits.get(value, 0)
+        return lambda mask: mask & bit != 0
+
+    names = [t[1] for t in value if t[0] == 'name']
+    parts = [_build_mask(t, bits) for t in value if t[0] != 'name']
+
+    if kind == '|':
+        any_bits = 0
+        for name in names:
+            any_bits |= bits.get(name, 0)
+        if not parts:
+            return lambda mask: mask & any_bits != 0
+        return lambda mask: mask & any_bits != 0 or any(p(mask) for p in parts)
+
+    all_bits = 0
+    for name in names:
+        bit = bits.get(name, 0)
+        if not bit:
+            # Nobody can have a role that doesn't exist.
+            return lambda mask: False
+        if bit & (bit - 1):
+            # Several roles share this name; any one will do.
+            parts.append(lambda mask, bit=bit: mask & bit != 0)
+        else:
+            all_bits |= bit
+    if not parts:
+        return lambda mask: mask & all_bits == all_bits
+    return lambda mask: mask & all_bits == all_bits and all(p(mask) for p in parts)
+
+
+class RoleExpression(object):
+    """
+    A compiled role expression. Call it with a set
+    of role names:
+
+    >>> expr = compile_roles('(admin|super_admin)&guest')
+    >>> expr(frozenset(['super_admin', 'guest']))
+    True
+
+    or test an integer role mask with matches_mask().
+
+    `names` holds every role name the expression uses.
+    """
+    __slots__ = ('source', 'names', '_tree', '_test', '_mask_test')
+
+    def __init__(self, source):
+        self.source = source
+        self._mask_test = None
+        if source.strip():
+            self._tree = _Parser(source).parse()
+            self.names = frozenset(_names(self._tree))
+            self._test = _build(self._tree)
+        else:
+            # An empty expression doesn't require any roles.
+            self._tree = None
+            self.names = frozenset()
+            self._test = lambda roles: True
+
+    def __call__(self, roles):
+        return self._test(roles)
+
+    def matches_mask(self, mask, bits):
+        """
+        Returns True if the integer role mask satisfies the
+        expression. `bits` maps role names to bits, see
+        role.bits_by_name(). The bitwise form is rebuilt
+        only when a different `bits` mapping is passed in.
+        """
+        if self._tree is None:
+            return True
+        compiled = self._mask_test
+        if compiled is None or compiled[0] is not bits:
+            compiled = self._mask_test = (bits, _build_mask(self._tree, bits))
+        return compiled[1](mask)
+
+    def __repr__(self):
+        return '<RoleExpression %r>' % self.source
+
+
+_compiled = {}
+
+def compile_roles(expression):
+    """
+    Returns the RoleExpression for expression. Each distinct
+    expression string is parsed only once per process.
+    """
+    if isinstance(expression, RoleExpression):
+        return expression
+    try:
+        return _compiled[expression]
+    except KeyError:
+        compiled = _compiled[expression] = RoleExpression(expression or '')
+        return compiled
 
 
 class SimpleRoleParser:
     """ Parses role string and evaluates whether use has role based permissions
     Typical usage in User/Person model as has_roles method for specific person:
-    
+
     def has_roles(self,roles_string):
         p=RoleParser(roles_string)
         r=[role.name for role in self.role_set.all()]
-        return p.has_roles(r)    
+        return p.has_roles(r)
+
+    Kept for compatibility; it tests role masks, like
+    Person.has_roles, so only names of existing roles count.
     """
     def __init__(self,s):
         """ e.g. s='(admin|super_admin)&guest'
         """
-        self.__spec_chars=['|','&','(',')']
-        s = s.replace(' ', '')
-        self.role_query=s
-        self.parsed_roles=self.__strip_roles(s)
-    
-    def __strip_roles(self,t):
-        """ Returns array of roles from role query. 
-        """
-        for c in self.__spec_chars:
-            t=t.replace(c,'|')
-        roles={}
-        for p in t.split('|'):
-            roles[p]=len(p)
-        x=self.__sortedDict(roles)
-        x.reverse()
-        return x
-
-    def __sortedDict(self,adict):
-        items = adict.items()
-        items.sort()
-        return [key for key, value in items if key != '']
+        self.role_query = s
+        self.expression = compile_roles(s)
 
     def has_roles(self,roles):
         """ Returns True/False info by evaluating expression
             e.g. roles=['admin', 'guest1']
         """
-        r=self.role_query
-        
-        for p in self.parsed_roles:
-            if p in roles:
-                r=r.replace(p,'True')
-            else:
-                r=r.replace(p,'False')
-        return eval(r)    
-
-
-
-
- 
-
-
+        from role import bits_by_name, mask_of
+        bits = bits_by_name(self.expression.names)
+        return self.expression.matches_mask(mask_of(roles, bits), bits)
@@ -5,9 +5,9 @@ import sha
 import random
 from accounts import Account
 from group import Group
-from role import Role
+from role import Role, bits_by_name, mask_of
 from django.conf import settings
-from parser import SimpleRoleParser
+from parser import compile_roles
 
 
 class Person(models.Model):
@@ -77,6 +77,7 @@ class Person(models.Model):
         if self.new_password:
             self.set_password(self.new_password)
             self.new_password = None
+        self.invalidate_roles()
             
         return super(Person, self).save(*args, **kwargs)
     
@@ -170,6 +171,31 @@ class Person(models.Model):
             except models.ObjectDoesNotExist:
                 return None
         
+    @classmethod
+    def load_with_account(cls, request):
+        """
+        Loads the logged in person and their account with one 
+        joined query, matching the account against HTTP_HOST.
+        Sets request.person, and request.account if the person 
+        was found. Returns the person or None.
+        """
+        request.person = None
+        host = request.META.get('HTTP_HOST')
+        if not host or cls.SESSION_KEY not in request.session:
+            return None
+        subdomain, domain = Account.split_host(host)
+        try:
+            person = Person.objects.select_related().get(
+                pk = request.session[cls.SESSION_KEY],
+                account__subdomain = subdomain,
+                account__domain = domain,
+            )
+        except models.ObjectDoesNotExist:
+            return None
+        request.person = person
+        request.account = person.account
+        return person
+        
     def has_roles(self,roles_string):
         """
         Returns True/False whether user has roles 
@@ -177,14 +203,62 @@ class Person(models.Model):
         """
         if not roles_string:
             return True
-        try:
-            if self.group and self.group.has_roles(roles_string):
-                return True
-        except Group.DoesNotExist:
-            pass
-        p=SimpleRoleParser(roles_string)
-        r=[role.name for role in self.role_set.all()]
-        return p.has_roles(r)        
+        expression = compile_roles(roles_string)
+        bits = bits_by_name(expression.names)
+        return expression.matches_mask(self._mask(bits), bits)
+        
+    @property
+    def effective_roles(self):
+        """
+        Frozenset with the names of the person's own roles and 
+        the roles of their group. 
+        """
+        return self._load_roles()[1]
+    
+    @property
+    def role_mask(self):
+        """
+        The person's own and group roles as an integer, with
+        Role.bit set for each. Cheap to test and compact 
+        enough to use in cache keys for role dependent output.
+        """
+        return self._mask(bits_by_name(self.effective_roles))
+    
+    def _mask(self, bits):
+        # Kept with the bits it was built from, since a role 
+        # deleted elsewhere can have its bit reused.
+        cached = getattr(self, '_role_mask', None)
+        roles = self._load_roles()
+        if cached and cached[0] is bits and cached[1] is roles:
+            return cached[2]
+        mask = mask_of(roles[1], bits)
+        self._role_mask = (bits, roles, mask)
+        return mask
+        
+    def _load_roles(self):
+        """
+        Loads the person's and the group's role names, a query 
+        each, and keeps them on the instance, so repeated 
+        permission checks during a request are free. Reloaded if the group changes; call 
+        invalidate_roles() after changing role_set directly.
+        """
+        cached = getattr(self, '_effective_roles', None)
+        if cached and cached[0] == self.group_id:
+            return cached
+        
+        # Two queries rather than one OR across both relations:
+        # the ORM joins those inner, which drops group-only roles.
+        names = set([role['name'] for role in 
+            Role.objects.filter(person_set__pk = self.pk).values('name')])
+        if self.group_id:
+            names.update([role['name'] for role in 
+                Role.objects.filter(group_set__pk = self.group_id).values('name')])
+        names = frozenset(names)
+        cached = self._effective_roles = (self.group_id, names)
+        return cached
+    
+    def invalidate_roles(self):
+        self._effective_roles = None
         
     def add_role(self, *names):
         """
@@ -192,6 +266,7 @@ class Person(models.Model):
         """
         for name in names:
             self.role_set.add(Role.objects.get(name=name))
+        self.invalidate_roles()
         
     def can_be_destroyed(self):
         return not self.has_roles('account_admin')
@@ -0,0 +1,249 @@
+from django.db import models, connection, transaction
+from django.db.models import signals
+from django.dispatch import dispatcher
+from django.core.exceptions import ImproperlyConfigured
+from account import subscription
+from accounts import Account
+
+
+class Plan(models.Model):
+    """
+    A subscription level kept in the database instead of
+    settings.SUBSCRIPTION_LEVELS; used when the setting
+    SUBSCRIPTION_PLANS_IN_DB is True. `position` is what
+    Account.subscription_level_id stores, so positions must
+    run 0, 1, 2... without gaps.
+    """
+    class Admin:
+        pass
+
+    class Meta:
+        app_label = 'account'
+        ordering = ('position',)
+
+    position = models.IntegerField(
+        unique = True,
+    )
+
+    handle = models.CharField(
+        max_length = 50,
+        unique = True,
+    )
+
+    name = models.CharField(
+        max_length = 100,
+    )
+
+    description = models.TextField(
+        blank = True,
+    )
+
+    # In cents, like the settings.
+    price = models.IntegerField(
+        default = 0,
+    )
+
+    period = models.IntegerField(
+        default = 1,
+    )
+
+    trial = models.IntegerField(
+        default = 0,
+    )
+
+    def __unicode__(self):
+        return self.name
+
+    @classmethod
+    def levels(cls):
+        """
+        Returns the plans as a list of SUBSCRIPTION_LEVELS
+        style dicts, in position order, with two queries.
+        """
+        resources = {}
+        for resource in PlanResource.objects.all():
+            resources.setdefault(resource.plan_id, {})[resource.name] = resource.limit
+        levels = []
+        for plan in cls.objects.order_by('position'):
+            if plan.position != len(levels):
+                raise ImproperlyConfigured(
+                    "Plan positions must be 0, 1, 2...; '%s' is at %i" % (
+                        plan.handle, plan.position
+                    )
+                )
+            levels.append({
+                'handle': plan.handle,
+                'name': plan.name,
+                'description': plan.description,
+                'price': plan.price,
+                'period': plan.period,
+                'trial': plan.trial,
+                'resources': resources.get(plan.id, {}),
+            })
+        return levels
+
+    @classmethod
+    @transaction.commit_on_success
+    def load_levels(cls, levels):
+        """
+        Creates or updates plans from SUBSCRIPTION_LEVELS style
+        dicts, in one transaction. Plans are matched on handle.
+        Plans whose handle is gone are deleted. Plans that move
+        to a new position take their accounts with them, since
+        Account.subscription_level_id is a position, not a key.
+        Raises ImproperlyConfigured, changing nothing, if a
+        plan that would be deleted still has accounts. Returns
+        the number of plans written.
+        """
+        plans = dict([(plan.handle, plan) for plan in cls.objects.all()])
+        handles = [level['handle'] for level in levels]
+        removed = [plan for handle, plan in plans.items() if handle not in handles]
+        stranded = Account.objects.filter(
+            subscription_level_id__in = [plan.position for plan in removed],
+        ).count()
+        if stranded:
+            raise ImproperlyConfigured(
+                "%i account(s) are still on plan(s) %s" % (
+                    stranded, ', '.join(sorted([plan.handle for plan in removed]))
+                )
+            )
+        for plan in removed:
+            plan.delete()
+
+        # Positions and account levels are unique or meaningful
+        # per value, so move in two steps: first out of the way
+        # to -1 - new position, then to the new position.
+        moves = []
+        for position, handle in enumerate(handles):
+            plan = plans.get(handle)
+            if plan is not None and plan.position != position:
+                moves.append((plan.position, position))
+                plan.position = -1 - position
+                plan.save()
+        if moves:
+            table = Account._meta.db_table
+            column = Account._meta.get_field('subscription_level_id').column
+            cursor = connection.cursor()
+            for old, new in moves:
+                cursor.execute(
+                    'UPDATE %s SET %s = %%s WHERE %s = %%s' % (table, column, column),
+                    [-1 - new, old],
+                )
+            cursor.execute(
+                'UPDATE %s SET %s = -1 - %s WHERE %s < 0' % (table, column, column, column)
+            )
+
+        for position, level in enumerate(levels):
+            plan = plans.get(level['handle']) or cls(handle = level['handle'])
+            plan.position = position
+            plan.name = level['name']
+            plan.description = level.get('description', '')
+            plan.price = level['price']
+            plan.period = level.get('period', 1)
+            plan.trial = level.get('trial', 0)
+            plan.save()
+
+            existing = dict([(r.name, r) for r in plan.resource_set.all()])
+            for name, limit in level['resources'].items():
+                resource = existing.pop(name, None) or PlanResource(plan = plan, name = name)
+                resource.limit = limit
+                resource.save()
+            for resource in existing.values():
+                resource.delete()
+        return len(levels)
+
+
+class PlanResource(models.Model):
+    """
+    One resource limit of a Plan. `value` is 'yes', 'no',
+    'unlimited' or a number.
+    """
+    class Admin:
+        pass
+
+    class Meta:
+        app_label = 'account'
+        unique_together = (
+            ("plan", "name"),
+        )
+
+    plan = models.ForeignKey(
+        to = Plan,
+        related_name = 'resource_set',
+    )
+
+    name = models.CharField(
+        max_length = 50,
+    )
+
+    value = models.CharField(
+        max_length = 20,
+    )
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.name, self.value)
+
+    def _get_limit(self):
+        value = self.value.strip().lower()
+        if value == 'unlimited':
+            return subscription.Unlimited
+        if value in ('yes', 'true'):
+            return True
+        if value in ('no', 'false'):
+            return False
+        try:
+            return int(value)
+        except ValueError:
+            raise ImproperlyConfigured(
+                "Bad value %r for resource '%s'" % (self.value, self.name)
+            )
+
+    def _set_limit(self, limit):
+        if limit is subscription.Unlimited:
+            self.value = 'unlimited'
+        elif limit is True or limit is False:
+            self.value = limit and 'yes' or 'no'
+        else:
+            self.value = str(int(limit))
+
+    limit = property(_get_limit, _set_limit)
+
+
+class PlanVersion(models.Model):
+    """
+    A single row counting changes to the plan tables. Each
+    process compares it to the version its catalog was built
+    from, every SUBSCRIPTION_PLANS_CHECK_INTERVAL seconds.
+    """
+    class Meta:
+        app_label = 'account'
+
+    version = models.IntegerField(
+        default = 0,
+    )
+
+    @classmethod
+    def current(cls):
+        cursor = connection.cursor()
+        cursor.execute('SELECT MAX(version) FROM %s' % cls._meta.db_table)
+        row = cursor.fetchone()
+        return row and row[0] or 0
+
+    @classmethod
+    def bump(cls):
+        cursor = connection.cursor()
+        cursor.execute('UPDATE %s SET version = version + 1' % cls._meta.db_table)
+        if cursor.rowcount == 0:
+            cls(version = 1).save()
+        transaction.commit_unless_managed()
+
+
+def _plans_changed(**kwargs):
+    PlanVersion.bump()
+    # Don't wait for the next check in this process.
+    subscription.expire_catalog()
+
+dispatcher.connect(_plans_changed, signal = signals.post_save, sender = Plan)
+dispatcher.connect(_plans_changed, signal = signals.post_delete, sender = Plan)
+dispatcher.connect(_plans_changed, signal = signals.post_save, sender = PlanResource)
+dispatcher.connect(_plans_changed, signal = signals.post_delete, sender = PlanResource)
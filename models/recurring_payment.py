@@ -94,16 +94,22 @@ class RecurringPayment(models.Model):
         return obj
         
     def change_amount(self, amount, **kwargs):
+        gateway.change_payment(**dict(self.change_payment_args(amount), **kwargs))
+        self.amount = '$' + str(amount)
+        
+    def change_payment_args(self, amount):
+        """
+        The keyword arguments of the gateway's change_payment 
+        call that change_amount(amount) makes.
+        """
         amount = str(amount)
-        gateway.change_payment(
+        return dict(
             url = settings.PAYMENT_GATEWAY_URL,
             login = settings.PAYMENT_GATEWAY_LOGIN,
             password = settings.PAYMENT_GATEWAY_PASSWORD,            
             amount = amount[:-2] + '.' + amount[-2:],
             gateway_token = self.gateway_token,
-            **kwargs
         )
-        self.amount = '$' + amount
         
     def cancel(self, **kwargs):
         gateway.cancel_payment(
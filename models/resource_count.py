@@ -0,0 +1,268 @@
+from django.db import models, connection, transaction, IntegrityError
+from django.db.models import signals
+from django.dispatch import dispatcher
+from accounts import Account, resources_changed
+from account import subscription
+
+
+class ResourceCount(models.Model):
+    """
+    Number of instances of a model that belong to an account.
+    Kept up to date by post_save / post_delete signals for
+    every model registered with subscription.count(), so
+    checking a 'people' or 'projects' resource is a single
+    row read instead of a COUNT(*).
+
+    Rows are created from a real count the first time they
+    are read. reconcile() recounts everything, to fix any
+    drift, e.g. from bulk deletes that don't send signals.
+    """
+    class Admin:
+        pass
+
+    class Meta:
+        app_label = 'account'
+        unique_together = (
+            ("account", "resource"),
+        )
+
+    account = models.ForeignKey(
+        to = Account,
+        related_name = 'resource_count_set',
+    )
+
+    # 'app_label.modelname'
+    resource = models.CharField(
+        max_length = 100,
+    )
+
+    total = models.IntegerField(
+        default = 0,
+    )
+
+    def __unicode__(self):
+        return u'%s: %i' % (self.resource, self.total)
+
+    @classmethod
+    def current(cls, account, app_label, model_name):
+        """
+        Returns how many model_name instances belong to account.
+        """
+        resource = subscription.model_key(app_label, model_name)
+        try:
+            return cls.objects.get(account = account, resource = resource).total
+        except cls.DoesNotExist:
+            cls._start(account.id, subscription._model(app_label, model_name), resource)
+            return cls.objects.get(account = account, resource = resource).total
+
+    @classmethod
+    def _start(cls, account_id, model, resource):
+        """
+        Creates a missing counter at 0, then sets it from a 
+        real count in one UPDATE. adjust() calls made while 
+        the row is missing are dropped, so creating it before
+        counting means none are lost in between.
+        """
+        savepoint = _savepoint()
+        try:
+            cls(account_id = account_id, resource = resource, total = 0).save()
+        except IntegrityError:
+            # Another request created the row first.
+            _savepoint_rollback(savepoint)
+        cursor = connection.cursor()
+        cursor.execute(
+            'UPDATE %s SET total = (%s) WHERE account_id = %%s AND resource = %%s' % (
+                cls._meta.db_table, cls._count_sql(model),
+            ),
+            [account_id, resource],
+        )
+        transaction.commit_unless_managed()
+
+    @classmethod
+    def _count_sql(cls, model):
+        """
+        A subquery counting the model's rows for the account
+        of the counter row being updated.
+        """
+        return 'SELECT COUNT(*) FROM %s WHERE %s.%s = %s.account_id' % (
+            model._meta.db_table, 
+            model._meta.db_table, 
+            model._meta.get_field('account').column,
+            cls._meta.db_table,
+        )
+
+    @classmethod
+    def current_many(cls, account, models):
+        """
+        Like current(), for a list of (app_label, model_name) 
+        pairs, with one query for all existing counters. 
+        Returns a dict of 'app_label.modelname' -> total.
+        """
+        keys = dict([
+            (subscription.model_key(app_label, model_name), (app_label, model_name))
+            for app_label, model_name in models
+        ])
+        totals = dict([
+            (counter.resource, counter.total) 
+            for counter in cls.objects.filter(account = account, resource__in = keys.keys())
+        ])
+        for key, (app_label, model_name) in keys.items():
+            if key not in totals:
+                totals[key] = cls.current(account, app_label, model_name)
+        return totals
+        
+    @classmethod
+    def reserve(cls, account, app_label, model_name, limit=None):
+        """
+        Adds one to a counter if that keeps it at or under
+        limit (None for no limit), in one conditional UPDATE
+        of a single row. Returns a Reservation, or None if 
+        the counter is full.
+        """
+        # Make sure the row exists.
+        cls.current(account, app_label, model_name)
+        resource = subscription.model_key(app_label, model_name)
+        sql = 'UPDATE %s SET total = total + 1 WHERE account_id = %%s AND resource = %%s' % (
+            cls._meta.db_table,
+        )
+        params = [account.id, resource]
+        if limit is not None:
+            sql += ' AND total < %s'
+            params.append(limit)
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        transaction.commit_unless_managed()
+        if cursor.rowcount != 1:
+            return None
+        resources_changed(account.id)
+        return Reservation(account.id, resource)
+        
+    @classmethod
+    def adjust(cls, account_id, resource, delta):
+        """
+        Atomically adds delta to a counter. Missing counters
+        are left alone; they start from a real count when
+        first read.
+        """
+        cursor = connection.cursor()
+        cursor.execute(
+            'UPDATE %s SET total = total + %%s WHERE account_id = %%s AND resource = %%s' % (
+                cls._meta.db_table,
+            ),
+            [delta, account_id, resource],
+        )
+        transaction.commit_unless_managed()
+
+    @classmethod
+    def reconcile(cls):
+        """
+        Recounts every registered model for every account.
+        Wrong counters are fixed with one UPDATE per model, 
+        which sets each from a COUNT subquery rather than 
+        writing back a number read earlier, so concurrent 
+        adjust() calls aren't overwritten with stale totals.
+        Missing counters are created with one grouped INSERT.
+        Returns the number of counters that were wrong or 
+        missing.
+        """
+        fixed = 0
+        cursor = connection.cursor()
+        for app_label, model_name in subscription.counted_models.values():
+            model = subscription._model(app_label, model_name)
+            resource = subscription.model_key(app_label, model_name)
+            count = cls._count_sql(model)
+            cursor.execute(
+                'UPDATE %s SET total = (%s) WHERE resource = %%s AND total <> (%s)' % (
+                    cls._meta.db_table, count, count,
+                ),
+                [resource],
+            )
+            fixed += cursor.rowcount
+            cursor.execute(
+                'INSERT INTO %(counters)s (account_id, resource, total) '
+                'SELECT %(column)s, %%s, COUNT(*) FROM %(table)s '
+                'WHERE %(column)s IS NOT NULL AND %(column)s NOT IN ('
+                'SELECT account_id FROM %(counters)s WHERE resource = %%s) '
+                'GROUP BY %(column)s' % {
+                    'counters': cls._meta.db_table,
+                    'table': model._meta.db_table,
+                    'column': model._meta.get_field('account').column,
+                },
+                [resource, resource],
+            )
+            fixed += cursor.rowcount
+            transaction.commit_unless_managed()
+        return fixed
+
+
+def _savepoint():
+    # Savepoints keep a failed INSERT from aborting a managed
+    # transaction, on Django versions that have them.
+    if hasattr(transaction, 'savepoint'):
+        return transaction.savepoint()
+    
+def _savepoint_rollback(savepoint):
+    if savepoint is not None:
+        transaction.savepoint_rollback(savepoint)
+    else:
+        transaction.rollback_unless_managed()
+        
+
+class Reservation(object):
+    """
+    One unit of a counted resource, taken by reserve(). 
+    Pass the new object to claim() before saving it, so the
+    save doesn't count it a second time. If the object is 
+    never saved, call release(). Inside a managed transaction
+    that is rolled back, the reservation is undone with it,
+    so don't release it as well.
+    """
+    def __init__(self, account_id, resource):
+        self.account_id = account_id
+        self.resource = resource
+        self.active = True
+        
+    def claim(self, instance):
+        instance._resource_reservation = self
+        
+    def release(self):
+        """
+        Gives the unit back. Does nothing once the claimed
+        object has been saved.
+        """
+        if self.active:
+            self.active = False
+            if self.resource is not None:
+                ResourceCount.adjust(self.account_id, self.resource, -1)
+                resources_changed(self.account_id)
+    
+    
+def _remember_if_new(sender, instance, **kwargs):
+    if _is_counted(sender):
+        instance._resource_count_new = instance._get_pk_val() is None
+
+def _count_saved(sender, instance, **kwargs):
+    if getattr(instance, '_resource_count_new', False):
+        instance._resource_count_new = False
+        reservation = getattr(instance, '_resource_reservation', None)
+        if reservation is not None and reservation.active and reservation.resource == _key(sender):
+            # Already counted when it was reserved.
+            reservation.active = False
+        else:
+            ResourceCount.adjust(instance.account_id, _key(sender), 1)
+        resources_changed(instance.account_id)
+
+def _count_deleted(sender, instance, **kwargs):
+    if _is_counted(sender) and instance.account_id:
+        ResourceCount.adjust(instance.account_id, _key(sender), -1)
+        resources_changed(instance.account_id)
+
+def _key(model):
+    return subscription.model_key(model._meta.app_label, model._meta.object_name)
+
+def _is_counted(model):
+    return _key(model) in subscription.counted_models
+
+dispatcher.connect(_remember_if_new, signal = signals.pre_save)
+dispatcher.connect(_count_saved, signal = signals.post_save)
+dispatcher.connect(_count_deleted, signal = signals.post_delete)
@@ -1,4 +1,7 @@
+import time
 from django.db import models
+from django.db.models import signals
+from django.dispatch import dispatcher
 #from person import Person
 from accounts import Account
 
@@ -7,6 +10,15 @@ class Role(models.Model):
     name = models.CharField(verbose_name = "Role name", max_length = 40)
     #persons = models.ManyToManyField(to=Person, related_name='persons')
     
+    # The role's bit in role masks, the lowest free one when
+    # the role was created, so masks stay small.
+    bit_index = models.IntegerField(
+        unique = True,
+        null = True,
+        blank = True,
+        editable = False,
+    )
+    
     class Admin:
         pass
     
@@ -17,4 +29,85 @@ class Role(models.Model):
     def __unicode__(self):
         return self.name
 
-        
+    def save(self, *args, **kwargs):
+        if self.bit_index is None:
+            self.bit_index = _free_bit_index()
+        super(Role, self).save(*args, **kwargs)
+
+    @property
+    def bit(self):
+        """
+        The role's bit in a person's role mask.
+        """
+        return 1 << self.bit_index
+    
+    
+def _free_bit_index():
+    used = set([row['bit_index'] for row in Role.objects.values('bit_index')])
+    index = 0
+    while index in used:
+        index += 1
+    return index
+
+def _assign_bit_indexes():
+    # Roles created before bit_index existed, or inserted
+    # without the model.
+    for role in Role.objects.filter(bit_index__isnull = True).order_by('id'):
+        role.save()
+
+    
+_bits_by_name = None
+_bits_loaded = 0
+
+# Roles may be added by other processes, which our signals 
+# don't see. Unknown names reload the table, at most this 
+# often, and the table is reloaded anyway once it is 
+# ROLE_MAX_AGE seconds old.
+ROLE_RELOAD_INTERVAL = 5
+ROLE_MAX_AGE = 60
+
+def bits_by_name(names=()):
+    """
+    Returns a dict of role name -> bit mask, loaded from 
+    the Role table once and reloaded after roles change.
+    If any of `names` is missing, the table is reloaded 
+    in case another process added the role. Treat the 
+    dict as read-only; a reload returns a new one, so masks
+    built from it with mask_of() can be kept with it.
+    """
+    global _bits_by_name, _bits_loaded
+    bits = _bits_by_name
+    if bits is not None:
+        age = time.time() - _bits_loaded
+        if age > ROLE_MAX_AGE:
+            bits = None
+        elif age > ROLE_RELOAD_INTERVAL and [name for name in names if name not in bits]:
+            bits = None
+    if bits is None:
+        rows = list(Role.objects.values('name', 'bit_index'))
+        if [row for row in rows if row['bit_index'] is None]:
+            _assign_bit_indexes()
+            rows = list(Role.objects.values('name', 'bit_index'))
+        bits = {}
+        for row in rows:
+            bits[row['name']] = bits.get(row['name'], 0) | (1 << row['bit_index'])
+        _bits_by_name = bits
+        _bits_loaded = time.time()
+    return bits
+
+def mask_of(names, bits):
+    """
+    The role mask for a set of role names, using the
+    `bits` returned by bits_by_name().
+    """
+    mask = 0
+    for name in names:
+        mask |= bits.get(name, 0)
+    return mask
+
+def _invalidate_bits(**kwargs):
+    global _bits_by_name
+    _bits_by_name = None
+
+dispatcher.connect(_invalidate_bits, signal = signals.post_save, sender = Role)
+dispatcher.connect(_invalidate_bits, signal = signals.post_delete, sender = Role)
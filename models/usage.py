@@ -0,0 +1,289 @@
+import atexit
+import datetime
+import logging
+import threading
+from django.conf import settings
+from django.db import models, connection, transaction
+from accounts import Account, resources_changed
+
+
+class UsageEvent(models.Model):
+    """
+    One entry of the append-only usage ledger, for resources
+    regulated with subscription.metered(). Record usage with
+    subscription.record_usage(); rows are written in batches.
+    rollup() folds new events into UsageTotal.
+    """
+    class Meta:
+        app_label = 'account'
+
+    account = models.ForeignKey(
+        to = Account,
+        related_name = 'usage_event_set',
+    )
+
+    resource = models.CharField(
+        max_length = 50,
+    )
+
+    amount = models.IntegerField()
+
+    recorded = models.DateTimeField()
+
+    def __unicode__(self):
+        return u'%s %+i' % (self.resource, self.amount)
+
+    @classmethod
+    def insert_many(cls, events):
+        """
+        Writes (account_id, resource, amount, recorded) tuples
+        with a single executemany().
+        """
+        if not events:
+            return
+        cursor = connection.cursor()
+        cursor.executemany(
+            'INSERT INTO %s (account_id, resource, amount, recorded) VALUES (%%s, %%s, %%s, %%s)' % (
+                cls._meta.db_table,
+            ),
+            events,
+        )
+        transaction.commit_unless_managed()
+
+    @classmethod
+    def rollup(cls, until=None):
+        """
+        Adds the events recorded since the last rollup to the
+        UsageTotal of their account, resource and month, in one
+        transaction. Events recorded at or after `until` (by
+        default SUBSCRIPTION_METER_ROLLUP_LAG seconds ago, 60
+        unless set) are left for a later run, so that batches
+        still being committed aren't skipped; the lag should be
+        well above SUBSCRIPTION_METER_MAX_AGE. Overlapping runs
+        wait for each other. Returns the number of totals 
+        changed.
+        """
+        if until is None:
+            until = datetime.datetime.now() - datetime.timedelta(
+                seconds = getattr(settings, 'SUBSCRIPTION_METER_ROLLUP_LAG', 60)
+            )
+        sums = cls._rollup(until)
+        for account_id, resource, period in sums:
+            resources_changed(account_id)
+        return len(sums)
+
+    @classmethod
+    @transaction.commit_on_success
+    def _rollup(cls, until):
+        first_id = UsageRollup.lock()
+        cursor = connection.cursor()
+        # Stop before the first event that is too recent, so
+        # the high-water mark never passes an event not yet
+        # rolled up.
+        cursor.execute(
+            'SELECT MIN(id) FROM %s WHERE id > %%s AND recorded >= %%s' % cls._meta.db_table,
+            [first_id, until],
+        )
+        end_id = cursor.fetchone()[0]
+        query = 'SELECT id, account_id, resource, recorded, amount FROM %s WHERE id > %%s AND recorded < %%s' % (
+            cls._meta.db_table,
+        )
+        params = [first_id, until]
+        if end_id is not None:
+            query += ' AND id < %s'
+            params.append(end_id)
+        cursor.execute(query, params)
+
+        sums = {}
+        last_id = first_id
+        for event_id, account_id, resource, recorded, amount in cursor.fetchall():
+            key = (account_id, resource, UsageTotal.period_of(recorded))
+            sums[key] = sums.get(key, 0) + amount
+            last_id = max(last_id, event_id)
+
+        for (account_id, resource, period), amount in sums.items():
+            UsageTotal.add(account_id, resource, period, amount)
+        if last_id != first_id:
+            UsageRollup.advance(last_id)
+        return sums
+
+
+class UsageTotal(models.Model):
+    """
+    Usage of a metered resource by an account in one month.
+    `period` is the first day of the month.
+    """
+    class Meta:
+        app_label = 'account'
+        unique_together = (
+            ("account", "resource", "period"),
+        )
+
+    account = models.ForeignKey(
+        to = Account,
+        related_name = 'usage_total_set',
+    )
+
+    resource = models.CharField(
+        max_length = 50,
+    )
+
+    period = models.DateField()
+
+    total = models.IntegerField(
+        default = 0,
+    )
+
+    def __unicode__(self):
+        return u'%s %s: %i' % (self.resource, self.period.strftime('%Y-%m'), self.total)
+
+    @staticmethod
+    def period_of(when):
+        return datetime.date(when.year, when.month, 1)
+
+    @classmethod
+    def current(cls, account, resource):
+        """
+        Returns the rolled up usage of resource this month.
+        """
+        try:
+            return cls.objects.get(
+                account = account,
+                resource = resource,
+                period = cls.period_of(datetime.date.today()),
+            ).total
+        except cls.DoesNotExist:
+            return 0
+
+    @classmethod
+    def add(cls, account_id, resource, period, amount):
+        cursor = connection.cursor()
+        cursor.execute(
+            'UPDATE %s SET total = total + %%s WHERE account_id = %%s AND resource = %%s AND period = %%s' % (
+                cls._meta.db_table,
+            ),
+            [amount, account_id, resource, period],
+        )
+        if cursor.rowcount == 0:
+            cls(account_id = account_id, resource = resource, period = period, total = amount).save()
+
+
+class UsageRollup(models.Model):
+    """
+    A single row holding the id of the last UsageEvent
+    included in the totals.
+    """
+    class Meta:
+        app_label = 'account'
+
+    last_event = models.IntegerField(
+        default = 0,
+    )
+
+    @classmethod
+    def lock(cls):
+        """
+        Returns the id of the last event rolled up, locking
+        the row until the transaction ends.
+        """
+        cursor = connection.cursor()
+        query = 'SELECT last_event FROM %s ORDER BY last_event DESC%s' % (
+            cls._meta.db_table, _for_update(),
+        )
+        cursor.execute(query)
+        row = cursor.fetchone()
+        if row is None:
+            cls(last_event = 0).save()
+            cursor.execute(query)
+            row = cursor.fetchone()
+        return row[0]
+
+    @classmethod
+    def advance(cls, last_event_id):
+        cursor = connection.cursor()
+        cursor.execute(
+            'UPDATE %s SET last_event = %%s' % cls._meta.db_table,
+            [last_event_id],
+        )
+        if cursor.rowcount == 0:
+            cls(last_event = last_event_id).save()
+
+
+def _for_update():
+    # SQLite has no row locks; a second writer fails instead.
+    if settings.DATABASE_ENGINE == 'sqlite3':
+        return ''
+    return ' FOR UPDATE'
+
+
+class UsageBuffer(object):
+    """
+    Collects usage events in memory and writes them with
+    UsageEvent.insert_many() from a background thread once 
+    `batch_size` are waiting or the oldest is `max_age` 
+    seconds old, and when the process exits. The thread has
+    its own database connection, so events outlive the
+    transaction of the request that recorded them. Events
+    that fail to insert are kept for the next flush. Events
+    still buffered when a process is killed are lost.
+    """
+    def __init__(self, batch_size=100, max_age=5):
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self._events = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, account_id, resource, amount):
+        self._lock.acquire()
+        try:
+            self._events.append((account_id, resource, amount, datetime.datetime.now()))
+            if self._thread is None:
+                self._thread = threading.Thread(target = self._run)
+                self._thread.setDaemon(True)
+                self._thread.start()
+            full = len(self._events) >= self.batch_size
+        finally:
+            self._lock.release()
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """
+        Inserts the buffered events in one transaction and
+        returns how many there were. If that fails they are
+        put back and the error raised.
+        """
+        self._lock.acquire()
+        try:
+            events, self._events = self._events, []
+        finally:
+            self._lock.release()
+        try:
+            UsageEvent.insert_many(events)
+        except:
+            transaction.rollback_unless_managed()
+            self._lock.acquire()
+            try:
+                self._events[:0] = events
+            finally:
+                self._lock.release()
+            raise
+        return len(events)
+
+    def _run(self):
+        while 1:
+            self._wake.wait(self.max_age)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception, e:
+                logging.error("Could not write usage events: %s" % e)
+                connection.close()
+
+usage_buffer = UsageBuffer(
+    batch_size = getattr(settings, 'SUBSCRIPTION_METER_BATCH_SIZE', 100),
+    max_age = getattr(settings, 'SUBSCRIPTION_METER_MAX_AGE', 5),
+)
+atexit.register(usage_buffer.flush)
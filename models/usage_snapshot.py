@@ -0,0 +1,148 @@
+import datetime
+from django.conf import settings
+from django.db import models
+from django.utils import simplejson
+from accounts import Account
+from account import subscription
+from account.lib.pool import WorkerPool
+
+
+class UsageSnapshot(models.Model):
+    """
+    How much of each resource an account used when last
+    measured, so pages can show "x of y used" for every
+    subscription level without running regulators inline.
+    Refreshed by the snapshot_usage command, and in the
+    background when a page finds it older than
+    SUBSCRIPTION_SNAPSHOT_MAX_AGE seconds (an hour by default).
+    """
+    class Admin:
+        pass
+
+    class Meta:
+        app_label = 'account'
+
+    account = models.ForeignKey(
+        to = Account,
+        unique = True,
+        related_name = 'usage_snapshot_set',
+    )
+
+    # JSON: resource name -> amount used, or null if the
+    # regulator can't tell.
+    data = models.TextField()
+
+    taken = models.DateTimeField()
+
+    def __unicode__(self):
+        return u'%s at %s' % (self.account, self.taken)
+
+    def _get_used(self):
+        return simplejson.loads(self.data)
+
+    def _set_used(self, used):
+        self.data = simplejson.dumps(used)
+
+    used = property(_get_used, _set_used)
+
+    def usage(self, level):
+        """
+        Returns a subscription.ResourceUsage of this snapshot
+        against the limits of level.
+        """
+        return level.usage_from(self.used)
+
+    def levels(self):
+        """
+        Returns a ResourceUsage for every subscription level.
+        """
+        used = self.used
+        return [level.usage_from(used) for level in subscription.catalog()]
+
+    def is_stale(self):
+        max_age = getattr(settings, 'SUBSCRIPTION_SNAPSHOT_MAX_AGE', 3600)
+        return datetime.datetime.now() - self.taken > datetime.timedelta(seconds = max_age)
+
+    @classmethod
+    def for_account(cls, account):
+        """
+        Returns the account's snapshot right away, starting a
+        background refresh if it is stale. An account that
+        was never measured gets an empty, unsaved snapshot.
+        """
+        try:
+            snapshot = cls.objects.get(account = account)
+        except cls.DoesNotExist:
+            snapshot = cls(account = account, data = '{}', taken = datetime.datetime.now())
+            _refresh_later(account)
+            return snapshot
+        if snapshot.is_stale():
+            _refresh_later(account)
+        return snapshot
+
+    @classmethod
+    def refresh(cls, account):
+        """
+        Measures every regulated resource of account and saves
+        the snapshot. count() resources are read in one query.
+        """
+        try:
+            snapshot = cls.objects.get(account = account)
+        except cls.DoesNotExist:
+            snapshot = cls(account = account)
+        snapshot.used = measure_all(account)
+        snapshot.taken = datetime.datetime.now()
+        snapshot.save()
+        return snapshot
+
+
+def measure_all(account):
+    """
+    Returns resource name -> amount used for every regulator
+    in SUBSCRIPTION_REGULATORS that can report an amount.
+    bounded() regulators are measured directly, since this
+    doesn't run in a request.
+    """
+    from resource_count import ResourceCount
+    regulators = {}
+    for name, regulator in getattr(settings, 'SUBSCRIPTION_REGULATORS', {}).items():
+        if isinstance(regulator, subscription.BoundedRegulator):
+            regulator = regulator.regulator
+        regulators[name] = regulator
+    counted = [r for r in regulators.values() if isinstance(r, subscription.ModelCount)]
+    totals = ResourceCount.current_many(
+        account,
+        [(r.app_label, r.model_name) for r in counted],
+    )
+    used = {}
+    for name, regulator in regulators.items():
+        if isinstance(regulator, subscription.ModelCount):
+            used[name] = totals[regulator.key]
+        elif isinstance(regulator, subscription.Regulator):
+            used[name] = regulator.usage(account)
+    return used
+
+
+_refreshing = set()
+
+# Refreshes measure every regulator, so they get threads of
+# their own rather than queueing with bounded() regulators.
+_refresh_pool = WorkerPool(getattr(settings, 'SUBSCRIPTION_SNAPSHOT_THREADS', 2))
+
+def _refresh_later(account):
+    if account.id in _refreshing:
+        return
+    _refreshing.add(account.id)
+    _refresh_pool.submit(_refresh, account.id)
+
+def _refresh(account_id):
+    try:
+        subscription._run_regulator(_refresh_account, account_id)
+    finally:
+        _refreshing.discard(account_id)
+
+def _refresh_account(account_id):
+    try:
+        UsageSnapshot.refresh(Account.objects.get(pk = account_id))
+    except Account.DoesNotExist:
+        pass
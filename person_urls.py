@@ -1,4 +1,5 @@
 from django.conf.urls.defaults import *
+from policy import AccessPolicy
 from models.person import Person
 from views import person_forms
 
@@ -10,30 +11,30 @@ urlpatterns = patterns('',
         r'^login/$', 
         _auth('login'), 
         {
-            'meta': {
-                'requires_logout': True,
-                'ssl': True,
-                'inactive_account_ok': True,
-            },
+            'meta': AccessPolicy(
+                requires_logout = True,
+                ssl = True,
+                inactive_account_ok = True,
+            ),
         }
     ),
     (
         r'^logout/$', 
         _auth('logout'), 
         {
-            'meta': {
-                'requires_login': True,
-                'inactive_account_ok': True,
-            },
+            'meta': AccessPolicy(
+                requires_login = True,
+                inactive_account_ok = True,
+            ),
         }
     ),
     (
         r'^reset_password/$', 
         _auth('reset_password'), 
         {
-            'meta': {
-                'requires_logout': True,
-            },
+            'meta': AccessPolicy(
+                requires_logout = True,
+            ),
         }
     ),
     (
@@ -68,9 +69,9 @@ urlpatterns = patterns('',
         r'^$', 
         _auth('edit_self'),
         {
-            'meta': {
-                'requires_login': True,
-            },
+            'meta': AccessPolicy(
+                requires_login = True,
+            ),
             'post_save_redirect': '/person/',
             'decorator': person_forms.decorate_person_form,
         }
@@ -79,9 +80,9 @@ urlpatterns = patterns('',
         r'^list/$', 
         'account.views.generic.list',
         {
-            'meta': {
-                'roles': 'account_admin',
-            },
+            'meta': AccessPolicy(
+                roles = 'account_admin',
+            ),
             'allow_empty': True,
             'queryset': Person.objects.all(),
             'template_name': 'account/person_list.html',
@@ -91,10 +92,10 @@ urlpatterns = patterns('',
         r'^create/$', 
         'account.views.generic.create',
         {
-            'meta': {
-                'roles': 'account_admin',
-                'ssl': True,
-            },
+            'meta': AccessPolicy(
+                roles = 'account_admin',
+                ssl = True,
+            ),
             'model': Person,
             'post_save_redirect': '/person/list/',
             'decorator': person_forms.decorate_person_form,
@@ -104,9 +105,9 @@ urlpatterns = patterns('',
         r'^edit/(\d+)/$', 
         'account.views.generic.edit',
         {
-            'meta': {
-                'roles': 'account_admin',
-            },
+            'meta': AccessPolicy(
+                roles = 'account_admin',
+            ),
             'model': Person,
             'post_save_redirect': '/person/list/',
             'decorator': person_forms.decorate_person_form,
@@ -116,9 +117,9 @@ urlpatterns = patterns('',
         r'^destroy/(\d+)/$', 
         'account.views.generic.destroy',
         {
-            'meta': {
-                'roles': 'account_admin',
-            },
+            'meta': AccessPolicy(
+                roles = 'account_admin',
+            ),
             'model': Person,
             'post_destroy_redirect': '/person/list/',
         }
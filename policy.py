@@ -0,0 +1,101 @@
+"""
+Access policies for the 'meta' option of account url patterns.
+See AccountBasedAuthentication.process_view for the rules.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from account.models.parser import compile_roles, RoleSyntaxError
+
+
+class AccessPolicy(object):
+    """
+    An immutable, pre-parsed version of a url's meta dict.
+    Use it in place of the dict in url patterns, so the
+    role expression is parsed once, when the urls are loaded:
+
+    (r'^$', 'view', {
+        'meta': AccessPolicy(requires_login = True, roles = 'account_admin'),
+    })
+
+    Role names that don't exist raise ImproperlyConfigured
+    from check_roles() instead of quietly denying access. The 
+    middleware calls it on first use, not at load time, so
+    loading the urls doesn't need the Role table.
+    """
+    __slots__ = (
+        'ssl',
+        'requires_account',
+        'inactive_account_ok',
+        'requires_login',
+        'requires_logout',
+        'requires_resource',
+        'roles',
+        '_roles_checked',
+    )
+
+    def __init__(self, ssl=False, requires_account=True,
+                 inactive_account_ok=False, requires_login=False,
+                 requires_logout=False, requires_resource=None, roles=None):
+        try:
+            expression = compile_roles(roles or '')
+        except RoleSyntaxError, e:
+            raise ImproperlyConfigured(str(e))
+
+        init = super(AccessPolicy, self).__setattr__
+        init('ssl', bool(ssl))
+        init('requires_account', bool(requires_account))
+        init('inactive_account_ok', bool(inactive_account_ok))
+        # Checking roles implies a login.
+        init('requires_login', bool(requires_login or roles is not None))
+        init('requires_logout', bool(requires_logout))
+        init('requires_resource', requires_resource)
+        init('roles', expression)
+        init('_roles_checked', False)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("AccessPolicy objects can't be changed.")
+
+    def __repr__(self):
+        return '<AccessPolicy %s>' % ', '.join(
+            ['%s=%r' % (name, getattr(self, name)) for name in self.__slots__
+             if not name.startswith('_')]
+        )
+
+    def check_roles(self):
+        """
+        Raises ImproperlyConfigured if the role expression
+        names a role that doesn't exist. Only the first call
+        reads the Role table.
+        """
+        if not self._roles_checked:
+            _check_role_names(self.roles)
+            super(AccessPolicy, self).__setattr__('_roles_checked', True)
+
+    @classmethod
+    def from_meta(cls, meta):
+        """
+        Returns the policy for a plain meta dict. The policy
+        is stored in the dict itself, so each url's dict is
+        only compiled once.
+        """
+        if isinstance(meta, cls):
+            return meta
+        policy = meta.get(_POLICY_KEY)
+        if policy is None:
+            policy = cls(**dict([
+                (str(k), v) for k, v in meta.items() if k != _POLICY_KEY
+            ]))
+            meta[_POLICY_KEY] = policy
+        return policy
+
+_POLICY_KEY = '_access_policy'
+
+
+def _check_role_names(expression):
+    if not expression.names:
+        return
+    from account.models.role import bits_by_name
+    unknown = expression.names.difference(bits_by_name(expression.names))
+    if unknown:
+        raise ImproperlyConfigured(
+            "Unknown role(s) %s in %r" % (', '.join(sorted(unknown)), expression.source)
+        )
@@ -1,7 +1,16 @@
 """
 Helper functions for defining SUBSCRIPTION_LEVELS
-and SUBSCRIPTION_REGULATORS
+and SUBSCRIPTION_REGULATORS, and the catalog that
+checks and indexes them.
 """
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from account.lib.cache import LRUCache
+from account.lib.pool import WorkerPool, TaskTimeout
+
 class Unlimited: 
     """
     When used like `resources = {'disk': Unlimited}`
@@ -9,17 +18,65 @@ class Unlimited:
     """
     pass
 
+# 'app_label.modelname' -> (app_label, model_name) for
+# every model counted by a count() regulator.
+counted_models = {}
+
+class Regulator(object):
+    """
+    Base class for regulators that can say how much of a 
+    resource an account uses. Called like a plain regulator 
+    function, it returns True if usage is under the limit.
+    """
+    def usage(self, account):
+        raise NotImplementedError
+    
+    def __call__(self, account, value):
+        return self.usage(account) < value
+    
+
+class ModelCount(Regulator):
+    """
+    Counts the instances of a model that belong to an 
+    account. See count().
+    """
+    def __init__(self, app_label, model_name):
+        self.app_label = app_label
+        self.model_name = model_name
+        self.key = model_key(app_label, model_name)
+        
+    def usage(self, account):
+        from account.models import ResourceCount
+        return ResourceCount.current(account, self.app_label, self.model_name)
+    
+    
+class ClassMethodUsage(Regulator):
+    """
+    Calls ModelName.method(account). See class_method().
+    """
+    def __init__(self, app_label, model_name, method):
+        self.app_label = app_label
+        self.model_name = model_name
+        self.method = method
+        
+    def usage(self, account):
+        return getattr(_model(self.app_label, self.model_name), self.method)(account)
+    
+
 def count(app_label, model_name):
     """
     Creates a subscription regulator function
     that sees how many Widget instances belong
     to an account. If it is under the maximum,
     return true. if over, return false.
+    
+    The number comes from a ResourceCount row that 
+    is kept up to date as instances are saved and 
+    deleted, rather than from a COUNT(*).
     """
-    def do_model_count(account, value):
-        model = _model(app_label, model_name)
-        return model.objects.filter(account = account).count() < value
-    return do_model_count
+    regulator = ModelCount(app_label, model_name)
+    counted_models[regulator.key] = (app_label, model_name)
+    return regulator
     
     
 def class_method(app_label, model_name, method):
@@ -29,12 +86,207 @@ def class_method(app_label, model_name, method):
     If the returned value is < the resource value, 
     returns true.
     """
-    def do_call_class_method(account, value):
-        model = _model(app_label, model_name)
-        return getattr(model, method)(account) < value
-    return do_call_class_method
+    return ClassMethodUsage(app_label, model_name, method)
 
 
+class DiskRegulator(Regulator):
+    """
+    Reads the size of an account's upload directory from 
+    the DiskUsage table. See disk().
+    """
+    def __init__(self, root, unit):
+        self.root = root
+        self.unit = unit
+        
+    def path(self, account):
+        if callable(self.root):
+            return self.root(account)
+        return self.root % account.__dict__
+    
+    def usage(self, account):
+        from account.models import DiskUsage
+        return DiskUsage.current(account, self.path(account)) * 1024 // self.unit
+    
+    
+def disk(root, unit=1024 * 1024):
+    """
+    Creates a subscription regulator that compares the 
+    size of an account's directory, in units of `unit` 
+    bytes (megabytes by default), to the resource value.
+    `root` is a callable that takes the account, or a 
+    format string like '/srv/uploads/%(subdomain)s'.
+    
+    Sizes are kept in the DiskUsage table, so requests
+    don't walk the directory; one never measured counts as
+    0 until a background scan stores it. Keep them current
+    with the scan_disk_usage command and DiskUsage.add_file()
+    / remove_file() in your upload views.
+    """
+    return DiskRegulator(root, unit)
+
+
+class BoundedRegulator(Regulator):
+    """
+    Runs another regulator on a worker thread and waits at 
+    most `timeout` seconds for it. See bounded().
+    """
+    def __init__(self, regulator, timeout, max_age, allow_on_timeout):
+        if not isinstance(regulator, Regulator):
+            raise ImproperlyConfigured(
+                "bounded() needs a count(), class_method() or other Regulator, not %r" % regulator
+            )
+        self.regulator = regulator
+        self.timeout = timeout
+        self.max_age = max_age
+        self.allow_on_timeout = allow_on_timeout
+        # account id -> (usage, time measured)
+        self.last_known = LRUCache(max_size = 10000)
+        # account id -> Task measuring it
+        self._refreshing = {}
+        self._lock = threading.Lock()
+        
+    def usage(self, account):
+        """
+        Returns the usage, or None if it couldn't be measured
+        in time and no earlier value is known.
+        """
+        known = self.last_known.get(account.id)
+        if known is not None and self.max_age is not None:
+            value, measured = known
+            if time.time() - measured > self.max_age:
+                self._refresh(account)
+            return value
+        try:
+            return self._refresh(account).wait(self.timeout)
+        except TaskTimeout:
+            if known is not None:
+                return known[0]
+            return None
+    
+    def __call__(self, account, value):
+        used = self.usage(account)
+        if used is None:
+            return self.allow_on_timeout
+        return used < value
+    
+    def _refresh(self, account):
+        """
+        Starts measuring account on the worker pool, unless 
+        that is already under way, and returns the Task.
+        """
+        self._lock.acquire()
+        try:
+            task = self._refreshing.get(account.id)
+            if task is None:
+                task = self._refreshing[account.id] = _regulator_pool().submit(self._measure, account)
+            return task
+        finally:
+            self._lock.release()
+        
+    def _measure(self, account):
+        try:
+            value = _run_regulator(self.regulator.usage, account)
+            self.last_known.set(account.id, (value, time.time()))
+            return value
+        finally:
+            self._lock.acquire()
+            self._refreshing.pop(account.id, None)
+            self._lock.release()
+    
+    
+def bounded(regulator, timeout=1.0, max_age=None, allow_on_timeout=False):
+    """
+    Wraps a slow regulator so a request waits at most 
+    `timeout` seconds for it:
+    
+    'disk': subscription.bounded(
+        subscription.class_method('files', 'Upload', 'bytes_used'),
+        timeout = 0.5, max_age = 300,
+    )
+    
+    If the regulator takes longer, the last value measured
+    for the account is used, or, if there is none, the 
+    resource is denied (allowed if allow_on_timeout is True).
+    With `max_age`, the last known value is served straight
+    away, and re-measured in the background once it is 
+    older than max_age seconds.
+    """
+    return BoundedRegulator(regulator, timeout, max_age, allow_on_timeout)
+
+
+class MeteredUsage(Regulator):
+    """
+    Reads this month's rolled up total of a metered 
+    resource. See metered().
+    """
+    def __init__(self, resource):
+        self.resource = resource
+        
+    def usage(self, account):
+        from account.models import UsageTotal
+        return UsageTotal.current(account, self.resource)
+    
+    
+def metered(resource):
+    """
+    Creates a subscription regulator for usage that is 
+    recorded as it happens (API calls, emails sent...) with
+    record_usage(account, resource, amount). It compares 
+    this month's total to the resource value. Totals are 
+    updated by the rollup_usage command, so run it often.
+    """
+    return MeteredUsage(resource)
+
+
+def record_usage(account, resource, amount=1):
+    """
+    Appends usage of a metered resource to the ledger. Events
+    are buffered and inserted in batches.
+    """
+    from account.models.usage import usage_buffer
+    usage_buffer.add(account.id, resource, amount)
+    
+    
+def disk_regulators():
+    """
+    Returns the DiskRegulators in SUBSCRIPTION_REGULATORS.
+    """
+    return [
+        regulator for regulator in getattr(settings, 'SUBSCRIPTION_REGULATORS', {}).values()
+        if isinstance(regulator, DiskRegulator)
+    ]
+    
+    
+_pool = None
+_pool_lock = threading.Lock()
+
+def _regulator_pool():
+    """
+    The worker threads for bounded() regulators and for
+    measure() when SUBSCRIPTION_REGULATOR_THREADS is set.
+    """
+    global _pool
+    _pool_lock.acquire()
+    try:
+        if _pool is None:
+            _pool = WorkerPool(max(getattr(settings, 'SUBSCRIPTION_REGULATOR_THREADS', 0), 2))
+        return _pool
+    finally:
+        _pool_lock.release()
+        
+def _run_regulator(function, *args):
+    """
+    Runs a regulator on a worker thread. Closes the thread's
+    database connection afterwards, as the end of a request 
+    would, so no idle transaction is left open.
+    """
+    from django.db import connection
+    try:
+        return function(*args)
+    finally:
+        connection.close()
+    
+    
 def _model(app_label, model_name):
     """ 
     Get a model class from app name and model name.
@@ -45,15 +297,371 @@ def _model(app_label, model_name):
     return get_model(app_label, model_name)
 
 
+def model_key(app_label, model_name):
+    return '%s.%s' % (app_label.lower(), model_name.lower())
 
 
+class SubscriptionLevel(object):
+    """
+    One entry of SUBSCRIPTION_LEVELS. Keys of the settings
+    dict are available as attributes, and, for existing code
+    and templates, as items: level.price == level['price'].
+    `checks` maps each resource to a (regulator, limit) pair.
+    regulator is None if the limit itself is the answer.
+    """
+    __slots__ = (
+        'index', 'handle', 'name', 'description', 'price',
+        'period', 'trial', 'resources', 'checks', 'extra',
+    )
+    
+    def __init__(self, index, settings_dict, regulators):
+        self.index = index
+        self.extra = dict(settings_dict)
+        try:
+            for key in ('handle', 'name', 'price', 'resources'):
+                setattr(self, key, self.extra.pop(key))
+        except KeyError, e:
+            raise ImproperlyConfigured(
+                "Subscription level #%i is missing %s" % (index, e)
+            )
+        self.description = self.extra.pop('description', '')
+        self.period = self.extra.pop('period', 1)
+        self.trial = self.extra.pop('trial', 0)
+        
+        self.checks = {}
+        for resource, limit in self.resources.items():
+            if limit is Unlimited or resource in regulators:
+                self.checks[resource] = (regulators.get(resource), limit)
+            elif isinstance(limit, (int, long, float)) and not isinstance(limit, bool):
+                raise ImproperlyConfigured(
+                    "Resource '%s' of subscription level '%s' has a numeric "
+                    "limit but no entry in SUBSCRIPTION_REGULATORS" % (resource, self.handle)
+                )
+            else:
+                self.checks[resource] = (None, limit)
+        
+    def has_resource(self, account, resource_name):
+        regulator, limit = self.checks[resource_name]
+        if limit is Unlimited:
+            return True
+        if regulator is None:
+            return limit
+        return regulator(account, limit)
+    
+    def reserve(self, account, resource_name):
+        """
+        Like has_resource, but for count() resources it also
+        takes one unit of the resource in a single atomic
+        UPDATE, so concurrent requests can't overshoot the 
+        limit. Returns a ResourceCount Reservation, or None 
+        if the resource isn't available.
+        """
+        from account.models.resource_count import ResourceCount, Reservation
+        regulator, limit = self.checks[resource_name]
+        if isinstance(regulator, ModelCount):
+            if limit is Unlimited:
+                limit = None
+            return ResourceCount.reserve(account, regulator.app_label, regulator.model_name, limit)
+        if self.has_resource(account, resource_name):
+            # Nothing to count; the check is all there is.
+            return Reservation(account.id, None)
+        return None
+    
+    def measure(self, account, resource_names=None):
+        """
+        Returns a ResourceUsage for the given resources (all
+        of them by default). The ResourceCount rows of every 
+        count() regulator are read in a single query; other 
+        regulators are run once each. Regulators of unlimited 
+        resources are only consulted if that is free.
+        """
+        if resource_names is None:
+            resource_names = self.checks.keys()
+        
+        counted = [
+            self.checks[name][0] for name in resource_names 
+            if isinstance(self.checks[name][0], ModelCount)
+        ]
+        totals = {}
+        if counted:
+            from account.models import ResourceCount
+            totals = ResourceCount.current_many(
+                account, 
+                [(r.app_label, r.model_name) for r in counted],
+            )
+        
+        tasks = {}
+        if getattr(settings, 'SUBSCRIPTION_REGULATOR_THREADS', 0):
+            # Start the other regulators together. bounded() 
+            # ones already use the pool, so they run here.
+            pool = _regulator_pool()
+            for name in resource_names:
+                regulator, limit = self.checks[name]
+                if (limit is not Unlimited and regulator is not None 
+                        and not isinstance(regulator, (ModelCount, BoundedRegulator))):
+                    if isinstance(regulator, Regulator):
+                        tasks[name] = pool.submit(_run_regulator, regulator.usage, account)
+                    else:
+                        tasks[name] = pool.submit(_run_regulator, regulator, account, limit)
+        timeout = getattr(settings, 'SUBSCRIPTION_REGULATOR_TIMEOUT', None)
+        deadline = None if timeout is None else time.time() + timeout
+        
+        snapshot = ResourceUsage(self)
+        for name in resource_names:
+            regulator, limit = self.checks[name]
+            used = None
+            if name in tasks:
+                try:
+                    result = tasks[name].wait(None if deadline is None else max(deadline - time.time(), 0))
+                except TaskTimeout:
+                    # Too slow; deny rather than hold up the page.
+                    snapshot.add(name, limit, None, False)
+                    continue
+                if isinstance(regulator, Regulator):
+                    used = result
+                else:
+                    snapshot.add(name, limit, None, result)
+                    continue
+            elif isinstance(regulator, ModelCount):
+                used = totals[regulator.key]
+            elif limit is not Unlimited and isinstance(regulator, Regulator):
+                used = regulator.usage(account)
+            
+            if limit is Unlimited:
+                allowed = True
+            elif used is not None:
+                allowed = used < limit
+            elif isinstance(regulator, BoundedRegulator):
+                allowed = regulator.allow_on_timeout
+            elif regulator is None:
+                allowed = limit
+            else:
+                allowed = regulator(account, limit)
+            snapshot.add(name, limit, used, allowed)
+        return snapshot
+    
+    def usage_from(self, used):
+        """
+        Returns a ResourceUsage built from stored amounts 
+        (resource name -> amount used) without running any 
+        regulator. `allowed` is None where the amounts can't 
+        tell.
+        """
+        snapshot = ResourceUsage(self)
+        for name, (regulator, limit) in self.checks.items():
+            amount = used.get(name)
+            if limit is Unlimited:
+                allowed = True
+            elif amount is not None:
+                allowed = amount < limit
+            elif regulator is None:
+                allowed = limit
+            else:
+                allowed = None
+            snapshot.add(name, limit, amount, allowed)
+        return snapshot
+    
+    def __getattr__(self, name):
+        if name == 'extra':
+            raise AttributeError(name)
+        try:
+            return self.extra[name]
+        except KeyError:
+            raise AttributeError(name)
+        
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+        
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+    
+    def __repr__(self):
+        return '<SubscriptionLevel %i: %s>' % (self.index, self.handle)
 
 
+class Usage(object):
+    """
+    How much of one resource an account uses. `used` is None
+    when the regulator can only answer yes or no.
+    """
+    __slots__ = ('name', 'limit', 'used', 'allowed')
+    
+    def __init__(self, name, limit, used, allowed):
+        self.name = name
+        self.limit = limit
+        self.used = used
+        self.allowed = allowed
+        
+    @property
+    def unlimited(self):
+        return self.limit is Unlimited
+    
+    @property
+    def measured(self):
+        return self.used is not None
+    
+    def __repr__(self):
+        return '<Usage %s: %r of %r>' % (self.name, self.used, self.limit)
+    
+    
+class ResourceUsage(object):
+    """
+    A snapshot of an account's resources at one subscription 
+    level, as returned by SubscriptionLevel.measure(). Index 
+    it by resource name to get a Usage:
+    
+    {{ usage.people.used }} of {{ usage.people.limit }}
+    """
+    def __init__(self, level):
+        self.level = level
+        self._resources = {}
+        
+    def add(self, name, limit, used, allowed):
+        self._resources[name] = Usage(name, limit, used, allowed)
+        
+    def allows(self, resource_name):
+        return self._resources[resource_name].allowed
+    
+    def __getitem__(self, resource_name):
+        return self._resources[resource_name]
+    
+    def __contains__(self, resource_name):
+        return resource_name in self._resources
+    
+    def __iter__(self):
+        names = self._resources.keys()
+        names.sort()
+        return iter([self._resources[name] for name in names])
+    
 
+class SubscriptionCatalog(object):
+    """
+    SUBSCRIPTION_LEVELS and SUBSCRIPTION_REGULATORS, checked 
+    and indexed. Levels are looked up by position (which is 
+    what Account.subscription_level_id stores) or by handle.
+    Raises ImproperlyConfigured for duplicate handles, levels 
+    that don't define the same resources, regulators for 
+    unknown resources and numeric limits without a regulator.
+    """
+    def __init__(self, levels, regulators):
+        self.source = (levels, regulators)
+        self.levels = tuple([
+            SubscriptionLevel(i, level, regulators) 
+            for i, level in enumerate(levels)
+        ])
+        
+        self._index = {}
+        for level in self.levels:
+            if level.handle in self._index:
+                raise ImproperlyConfigured(
+                    "Duplicate subscription level handle '%s'" % level.handle
+                )
+            self._index[level.handle] = level.index
+        
+        resources = set()
+        for level in self.levels:
+            resources.update(level.resources)
+        for level in self.levels:
+            missing = resources.difference(level.resources)
+            if missing:
+                raise ImproperlyConfigured(
+                    "Subscription level '%s' doesn't define %s" % (
+                        level.handle, ', '.join(sorted(missing))
+                    )
+                )
+        unknown = set(regulators).difference(resources)
+        if unknown:
+            raise ImproperlyConfigured(
+                "SUBSCRIPTION_REGULATORS has no level with %s" % ', '.join(sorted(unknown))
+            )
+        
+    def index(self, handle):
+        """
+        Returns the position of the level with this handle.
+        """
+        try:
+            return self._index[handle]
+        except KeyError:
+            raise ImproperlyConfigured("Unknown subscription level '%s'" % handle)
+        
+    def find(self, handle):
+        return self.levels[self.index(handle)]
+        
+    def __getitem__(self, index):
+        if index < 0:
+            # Negative indexes would silently wrap around.
+            raise IndexError(index)
+        return self.levels[index]
+    
+    def __iter__(self):
+        return iter(self.levels)
+    
+    def __len__(self):
+        return len(self.levels)
+    
 
+_catalog = None
+# (time of the last plan version check, version found)
+_plans_checked = (0, None)
 
+def catalog():
+    """
+    Returns the SubscriptionCatalog for the current settings.
+    It is built once, and again only if SUBSCRIPTION_LEVELS
+    or SUBSCRIPTION_REGULATORS is replaced.
+    
+    With SUBSCRIPTION_PLANS_IN_DB = True the levels come from
+    the Plan tables instead. The plan version is checked at 
+    most every SUBSCRIPTION_PLANS_CHECK_INTERVAL seconds (30 
+    by default), and the plans reloaded only if it changed.
+    If the changed plans don't validate, the error is logged
+    and the last good catalog kept.
+    """
+    global _catalog
+    regulators = getattr(settings, 'SUBSCRIPTION_REGULATORS', {})
+    if getattr(settings, 'SUBSCRIPTION_PLANS_IN_DB', False):
+        return _plan_catalog(regulators)
+    levels = settings.SUBSCRIPTION_LEVELS
+    current = _catalog
+    if current is None or current.source[0] is not levels or current.source[1] is not regulators:
+        current = _catalog = SubscriptionCatalog(levels, regulators)
+    return current
 
+def _plan_catalog(regulators):
+    global _catalog, _plans_checked
+    current = _catalog
+    checked, version = _plans_checked
+    interval = getattr(settings, 'SUBSCRIPTION_PLANS_CHECK_INTERVAL', 30)
+    now = time.time()
+    if (current is not None and getattr(current, 'version', None) == version
+            and current.source[1] is regulators and now - checked < interval):
+        return current
+    
+    from account.models import Plan, PlanVersion
+    version = PlanVersion.current()
+    _plans_checked = (now, version)
+    if current is None or getattr(current, 'version', None) != version or current.source[1] is not regulators:
+        try:
+            rebuilt = SubscriptionCatalog(Plan.levels(), regulators)
+        except ImproperlyConfigured, e:
+            # Only fail when there is nothing to serve. Otherwise
+            # keep the last good catalog until the plans are fixed,
+            # trying again after the next check interval.
+            if current is None or not hasattr(current, 'version'):
+                raise
+            logging.error("Keeping subscription plans version %s: %s" % (current.version, e))
+            _plans_checked = (now, current.version)
+            return current
+        rebuilt.version = version
+        current = _catalog = rebuilt
+    return current
 
-
-
-
+def expire_catalog():
+    """
+    Makes the next catalog() call check the plan version.
+    """
+    global _plans_checked
+    _plans_checked = (0, None)
@@ -2,9 +2,22 @@ import unittest
 import sys
 from functional.account_tags_tests import AccountTagsTests
 from functional.account_tests import AccountTests
+from functional.resource_count_tests import ResourceCountTests, ReservationTests
+from functional.resource_usage_tests import ResourceUsageTests
+from functional.disk_usage_tests import DiskUsageTests
+from functional.plan_tests import PlanTests
+from functional.bounded_regulator_tests import BoundedRegulatorTests
+from functional.usage_tests import MeteredUsageTests
+from functional.usage_snapshot_tests import UsageSnapshotTests
 from functional.person_tests import PersonTests
 from functional.group_tests import GroupTests
 from functional.recurring_payment_tests import RecurringPaymentTests
+from functional.policy_tests import AccessPolicyTests
+from functional.session_tests import SessionStoreTests
+from functional.authorize_net_tests import AuthorizeNetTests
+from functional.middleware_tests import LazyRequestTests
+from functional.connection_pool_tests import ConnectionPoolTests
+from functional.pool_tests import WorkerPoolTests
 from integration.subscription_tests import SubscriptionTests
 from integration.authentication_tests import AuthenticationTests
 from integration.profile_tests import ProfileTests
@@ -12,9 +25,23 @@ from integration.profile_tests import ProfileTests
 test_cases = [
     AccountTagsTests,
     AccountTests, 
+    ResourceCountTests,
+    ReservationTests,
+    ResourceUsageTests,
+    DiskUsageTests,
+    PlanTests,
+    BoundedRegulatorTests,
+    MeteredUsageTests,
+    UsageSnapshotTests,
     PersonTests, 
     GroupTests,
     RecurringPaymentTests, 
+    AccessPolicyTests,
+    SessionStoreTests,
+    AuthorizeNetTests,
+    LazyRequestTests,
+    ConnectionPoolTests,
+    WorkerPoolTests,
     SubscriptionTests,
     AuthenticationTests,
     ProfileTests,
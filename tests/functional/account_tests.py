@@ -1,40 +1,23 @@
 from django.test import Client, TestCase
 from django.contrib.auth.models import User
 from account.models import Account
+from account.models.accounts import host_cache
 from account import subscription
 from django.conf import settings
 from account.tests.mocks import subscription_levels
+from account.tests.mocks.accounts import make_account
 
 class AccountTests(TestCase):
         
         
-    def make_account(self, level=1, people=1):
-        """
-        Utility method: creates an account with
-        a specific subscription level and # people
-        """
-        account = Account(
-            subscription_level_id = level,
-        )
-        account.save()
-        for i in range(people):
-            account.person_set.create(
-                username = 'person %i' % i,
-                password = 'password %i' % i,
-                first_name = 'first_name %i' % i,
-                last_name = 'last_name %i' % i,
-                email = 'email_%i@email.com' % i,
-            )
-        return account
-        
-    
     def test_silver_subscription_level(self):
         """
         Tests one of the subscription levels defined
         in setUp()
         """
-        account = self.make_account(level = 1, people = 2)
-        assert account.subscription_level == settings.SUBSCRIPTION_LEVELS[1]
+        account = make_account(level = 1, people = 2)
+        assert account.subscription_level is subscription.catalog()[1]
+        assert account.subscription_level.handle == settings.SUBSCRIPTION_LEVELS[1]['handle']
         assert not account.has_resource('ssl')
         assert not account.has_resource('disk')
         assert not account.has_resource('projects')
@@ -44,14 +27,14 @@ class AccountTests(TestCase):
         assert account.has_level_or_greater('silver') 
         assert account.requires_payment()
         
-        
     def test_gold_subscription_level(self):
         """
         Tests one of the subscription levels defined
         in setUp()
         """
-        account = self.make_account(level = 2, people = 10)
-        assert account.subscription_level == settings.SUBSCRIPTION_LEVELS[2]
+        account = make_account(level = 2, people = 10)
+        assert account.subscription_level is subscription.catalog()[2]
+        assert account.subscription_level.handle == settings.SUBSCRIPTION_LEVELS[2]['handle']
         assert account.has_resource('ssl')
         assert account.has_resource('disk')
         assert account.has_resource('projects')
@@ -62,5 +45,50 @@ class AccountTests(TestCase):
         assert account.has_level_or_greater('gold') 
         assert account.requires_payment()
         
-  
-        
\ No newline at end of file
+    def test_load_from_request_is_cached(self):
+        """
+        Host lookups, including misses, are served from
+        host_cache until the account is saved.
+        """
+        host_cache.clear()
+        host_cache.reset_stats()
+        account = Account(subdomain = 'cached', domain = 'localhost', name = 'Cached')
+        account.save()
+        
+        request = MockRequest('cached.localhost')
+        assert Account.load_from_request(request) == account
+        assert Account.load_from_request(request) == account
+        assert host_cache.stats()['hits'] == 1
+        assert host_cache.stats()['misses'] == 1
+        
+        # Each request gets its own copy
+        request.account.name = 'Changed'
+        assert Account.load_from_request(request).name == 'Cached'
+        
+        # Renaming the subdomain invalidates the old host
+        account.subdomain = 'renamed'
+        account.save()
+        assert Account.load_from_request(request) is None
+        assert Account.load_from_request(MockRequest('renamed.localhost')) == account
+        
+    def test_unknown_host_is_cached(self):
+        host_cache.clear()
+        request = MockRequest('nobody.localhost')
+        assert Account.load_from_request(request) is None
+        assert 'nobody.localhost' in host_cache._data
+        
+        # Creating the account drops the negative entry
+        account = Account(subdomain = 'nobody', domain = 'localhost', name = 'Nobody')
+        account.save()
+        assert Account.load_from_request(request) == account
+        
+    def test_load_from_request_without_host(self):
+        request = MockRequest(None)
+        assert Account.load_from_request(request) is None
+        
+        
+class MockRequest:
+    def __init__(self, host):
+        self.META = {}
+        if host:
+            self.META['HTTP_HOST'] = host
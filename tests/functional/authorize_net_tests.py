@@ -0,0 +1,96 @@
+import threading
+from django.test import TestCase
+from account.lib.payment import authorize_net
+from account.tests.mocks.authorize_net_responses import OK, ERROR, GARBAGE
+from account.lib.payment.batch import ConcurrentGateway
+from account.lib.payment.errors import PaymentRequestError, PaymentResponseError
+from account.tests.mocks.payment_gateway import MockGateway
+
+class AuthorizeNetTests(TestCase):
+    
+    def test_ok_response(self):
+        self.assertEqual(authorize_net._process_response(OK), '100748')
+        self.assertEqual(
+            authorize_net._process_response('<r><resultCode> OK </resultCode></r>'), 
+            True,
+        )
+        
+    def test_error_response(self):
+        try:
+            authorize_net._process_response(ERROR)
+            assert False
+        except PaymentRequestError, e:
+            self.assertEqual(e.messages, [
+                ('E00003', "The element 'amount' has an invalid value."),
+                ('E00012', 'A duplicate subscription already exists.'),
+            ])
+            
+    def test_unknown_response(self):
+        for xml in (GARBAGE, '<r><resultCode>Maybe</resultCode></r>', 'not xml <'):
+            try:
+                authorize_net._process_response(xml)
+                assert False
+            except PaymentResponseError, e:
+                self.assertEqual(e.response, xml)
+                
+    def test_only_direct_text(self):
+        xml = '<r><resultCode>o<b>x</b>k</resultCode><subscriptionId>1<i>2</i></subscriptionId></r>'
+        self.assertEqual(authorize_net._process_response(xml), '1')
+                
+    def test_request_values_are_escaped(self):
+        xml = authorize_net._change_payment.render({
+            'login': 'Smith & <Sons>',
+            'password': u'p\xe4ss',
+            'gateway_token': 7,
+            'amount': '9.99',
+        })
+        assert '<name>Smith &amp; &lt;Sons&gt;</name>' in xml
+        assert '<transactionKey>p\xc3\xa4ss</transactionKey>' in xml
+        assert '<subscriptionId>7</subscriptionId>' in xml
+        assert '{{' not in xml
+        
+    def test_concurrent_gateway(self):
+        gateway = ConcurrentGateway(MockGateway(), max_concurrency = 4)
+        results = list(gateway.run_all('change_payment', [
+            {'gateway_token': '1'},
+            {'gateway_token': '2', 'error': PaymentRequestError},
+            {'gateway_token': '3'},
+        ]))
+        self.assertEqual([r[0]['gateway_token'] for r in results], ['1', '2', '3'])
+        self.assertEqual(results[0][1:], (True, None))
+        assert isinstance(results[1][2], PaymentRequestError)
+        self.assertEqual(gateway.cancel_payment(gateway_token = '3').result(), True)
+        gateway.close()
+        
+    def test_deadline_starts_when_call_runs(self):
+        """
+        Calls waiting for a thread don't use up their timeout.
+        """
+        release = threading.Event()
+        class SlowGateway(MockGateway):
+            def change_payment(self, **kwargs):
+                release.wait()
+                return MockGateway.change_payment(self, **kwargs)
+        gateway = ConcurrentGateway(SlowGateway(), max_concurrency = 1, timeout = 60)
+        try:
+            first = gateway.change_payment(gateway_token = '1')
+            second = gateway.change_payment(gateway_token = '2')
+            self.assertEqual(second.deadline, None)
+            release.set()
+            self.assertEqual(first.result(), True)
+            self.assertEqual(second.result(), True)
+            assert second.deadline is not None
+        finally:
+            release.set()
+            gateway.close()
+            
+    def test_close_stops_threads(self):
+        gateway = ConcurrentGateway(MockGateway(), max_concurrency = 3)
+        calls = [gateway.change_payment(gateway_token = str(i)) for i in range(3)]
+        threads = list(gateway._pool._threads)
+        gateway.close()
+        for call in calls:
+            self.assertEqual(call.result(), True)
+        for thread in threads:
+            thread.join(5)
+            assert not thread.isAlive()
@@ -0,0 +1,37 @@
+import threading
+from django.test import TestCase
+from account.models import Account
+from account import subscription
+from account.tests.mocks import subscription_levels
+from account.tests.mocks.accounts import make_account
+
+class BoundedRegulatorTests(TestCase):
+    
+    def test_bounded_regulator(self):
+        """
+        A bounded regulator gives up after its timeout and 
+        later serves the value measured in the background.
+        """
+        account = make_account(level = 1, people = 1)
+        release = threading.Event()
+        def slow_disk_used(account):
+            release.wait()
+            return 100
+        Account.slow_disk_used = slow_disk_used
+        try:
+            regulator = subscription.bounded(
+                subscription.class_method('account', 'Account', 'slow_disk_used'),
+                timeout = 0.05,
+                max_age = 60,
+            )
+            self.assertEqual(regulator.usage(account), None)
+            assert not regulator(account, 1000)
+            
+            task = regulator._refresh(account)
+            release.set()
+            self.assertEqual(task.wait(5), 100)
+            self.assertEqual(regulator.usage(account), 100)
+            assert regulator(account, 1000)
+        finally:
+            release.set()
+            del Account.slow_disk_used
@@ -0,0 +1,68 @@
+import httplib
+from django.test import TestCase
+from account.lib.payment.errors import PaymentResponseError
+from account.tests.mocks.http_connection import MockResponse, MockConnection, MockConnectionPool
+
+URL = 'https://gateway.example.com/xml/v1/request.api'
+
+class ConnectionPoolTests(TestCase):
+    
+    def test_reuses_connection(self):
+        connection = MockConnection(MockResponse('one'), MockResponse('two'))
+        pool = MockConnectionPool(connection)
+        self.assertEqual(pool.post(URL, 'a'), 'one')
+        self.assertEqual(pool.post(URL, 'b'), 'two')
+        self.assertEqual(pool.opened, [connection])
+        self.assertEqual(connection.requests, ['a', 'b'])
+        
+    def test_closes_connection_server_will_close(self):
+        first = MockConnection(MockResponse('one', will_close = True))
+        second = MockConnection(MockResponse('two'))
+        pool = MockConnectionPool(first, second)
+        pool.post(URL, 'a')
+        assert first.sock is None
+        self.assertEqual(pool.post(URL, 'b'), 'two')
+        self.assertEqual(pool.opened, [first, second])
+        
+    def test_drops_connection_closed_by_server(self):
+        """
+        An idle connection the server hung up on is replaced
+        before anything is sent on it.
+        """
+        first = MockConnection(MockResponse('one'), MockResponse('unused'))
+        second = MockConnection(MockResponse('two'))
+        pool = MockConnectionPool(first, second)
+        pool.post(URL, 'a')
+        first.server.close()
+        self.assertEqual(pool.post(URL, 'b'), 'two')
+        self.assertEqual(first.requests, ['a'])
+        self.assertEqual(second.requests, ['b'])
+        assert first.sock is None
+        
+    def test_retries_request_that_could_not_be_sent(self):
+        first = MockConnection(MockResponse('one'))
+        second = MockConnection(MockResponse('two'))
+        pool = MockConnectionPool(first, second)
+        pool.post(URL, 'a')
+        first.busy = True
+        self.assertEqual(pool.post(URL, 'b'), 'two')
+        self.assertEqual(first.requests, ['a'])
+        self.assertEqual(second.requests, ['b'])
+        
+    def test_does_not_resend_after_failure(self):
+        """
+        Once a request is sent a failure is raised, not 
+        retried, since the gateway may have acted on it. The
+        broken connection isn't reused.
+        """
+        first = MockConnection(MockResponse('one'), httplib.BadStatusLine(''))
+        second = MockConnection(MockResponse('three'))
+        pool = MockConnectionPool(first, second)
+        pool.post(URL, 'a')
+        self.assertRaises(PaymentResponseError, pool.post, URL, 'b')
+        self.assertEqual(first.requests, ['a', 'b'])
+        self.assertEqual(pool.opened, [first])
+        assert first.sock is None
+        
+        self.assertEqual(pool.post(URL, 'c'), 'three')
+        self.assertEqual(pool.opened, [first, second])
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+from django.test import TestCase
+from account.models import DiskUsage
+from account.models import disk_usage
+from account import subscription
+from account.tests.mocks import subscription_levels
+from account.tests.mocks.accounts import make_account
+
+class DiskUsageTests(TestCase):
+    
+    def test_disk_regulator(self):
+        """
+        subscription.disk regulators read a stored total that
+        is kept current by the upload hooks.
+        """
+        account = make_account(level = 1, people = 1)
+        root = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(root, 'images'))
+            open(os.path.join(root, 'a.txt'), 'wb').write('x' * 1500)
+            open(os.path.join(root, 'images', 'b.png'), 'wb').write('x' * 10)
+            
+            regulator = subscription.disk(root, unit = 1024)
+            other = subscription.disk(os.path.join(root, 'images'), unit = 1024)
+            self.assertEqual(DiskUsage.scan(account, root), 3)
+            self.assertEqual(DiskUsage.scan(account, os.path.join(root, 'images')), 1)
+            self.assertEqual(regulator.usage(account), 3)
+            self.assertEqual(other.usage(account), 1)
+            assert regulator(account, 4)
+            
+            path = os.path.join(root, 'images', 'c.png')
+            open(path, 'wb').write('x' * 2048)
+            DiskUsage.add_file(account.id, path)
+            self.assertEqual(regulator.usage(account), 5)
+            self.assertEqual(other.usage(account), 3)
+            assert not regulator(account, 4)
+            
+            DiskUsage.remove_file(account.id, path)
+            os.remove(path)
+            self.assertEqual(regulator.usage(account), 3)
+            self.assertEqual(other.usage(account), 1)
+            self.assertEqual(DiskUsage.scan(account, root), 3)
+        finally:
+            shutil.rmtree(root)
+        
+    def test_disk_regulator_does_not_scan_in_request(self):
+        """
+        A directory that was never measured counts as 0 
+        rather than being walked by the request.
+        """
+        account = make_account(level = 1, people = 1)
+        old_scan_later = disk_usage._scan_later
+        queued = []
+        disk_usage._scan_later = lambda account, path: queued.append((account.id, path))
+        root = tempfile.mkdtemp()
+        try:
+            open(os.path.join(root, 'a.txt'), 'wb').write('x' * 1500)
+            regulator = subscription.disk(root, unit = 1024)
+            self.assertEqual(regulator.usage(account), 0)
+            self.assertEqual(queued, [(account.id, root)])
+        finally:
+            disk_usage._scan_later = old_scan_later
+            shutil.rmtree(root)
@@ -41,6 +41,19 @@ class GroupTests(TestCase):
             self.person_one.has_roles('employee')
         )
     
+    def test_person_with_only_group_roles(self):
+        """
+        Roles granted only through the group count even
+        when the person has none of their own.
+        """
+        self.person_one.role_set.clear()
+        self.person_one.group = Group.objects.get(name = 'Employees')
+        self.person_one.invalidate_roles()
+        self.assertTrue(
+            self.person_one.has_roles('employee')
+        )
+        self.assertTrue('employee' in self.person_one.effective_roles)
+    
     def test_duplicate_name(self):
         account = Account.objects.get(pk=1)
         g1 = Group(account = account, name = "samenamegame")
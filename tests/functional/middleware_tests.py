@@ -0,0 +1,83 @@
+from django.test import TestCase
+from account.models import Person, Account
+from account.middleware import AccountBasedAuthentication
+
+class LazyRequestTests(TestCase):
+    fixtures = [
+        'test/accounts.json', 
+        'test/people.json', 
+        'test/roles.json',
+    ]
+    
+    loaders = [
+        (Person, 'load_with_account'),
+        (Person, 'load_from_request'),
+        (Account, 'load_from_request'),
+    ]
+    
+    def setUp(self):
+        self.person = Person.objects.get(username = 'snhorne')
+        self.calls = []
+        self.originals = []
+        for model, name in self.loaders:
+            self.originals.append((model, name, model.__dict__[name]))
+            setattr(model, name, classmethod(self.counting(model, name)))
+        
+    def tearDown(self):
+        for model, name, original in self.originals:
+            setattr(model, name, original)
+        
+    def counting(self, model, name):
+        """
+        Wraps a loader so each call is recorded in self.calls
+        """
+        original = getattr(model, name)
+        def counted(cls, request):
+            self.calls.append('%s.%s' % (model.__name__, name))
+            return original(request)
+        return counted
+    
+    def make_request(self, logged_in=True):
+        class Request(object):
+            pass
+        request = Request()
+        request.META = {'HTTP_HOST': 'starr.localhost'}
+        request.session = {}
+        if logged_in:
+            request.session[Person.SESSION_KEY] = self.person.id
+        AccountBasedAuthentication().process_request(request)
+        return request
+    
+    def test_nothing_loaded_until_used(self):
+        request = self.make_request()
+        self.assertEqual(self.calls, [])
+        assert 'person' not in request.__dict__
+        assert 'account' not in request.__dict__
+        
+    def test_person_and_account_loaded_together(self):
+        request = self.make_request()
+        self.assertEqual(request.person, self.person)
+        self.assertEqual(request.account, self.person.account)
+        self.assertEqual(self.calls, ['Person.load_with_account'])
+        
+    def test_values_are_cached(self):
+        request = self.make_request()
+        account = request.account
+        person = request.person
+        assert request.account is account
+        assert request.person is person
+        self.assertEqual(len(self.calls), 1)
+        
+    def test_anonymous_request_has_no_person(self):
+        request = self.make_request(logged_in = False)
+        self.assertEqual(request.account.subdomain, 'starr')
+        self.assertEqual(request.person, None)
+        assert 'Person.load_from_request' not in self.calls
+        
+    def test_login_and_logout_override_lazy_person(self):
+        request = self.make_request(logged_in = False)
+        self.person.login(request)
+        assert request.person is self.person
+        Person.logout(request)
+        self.assertEqual(request.person, None)
+        self.assertEqual(self.calls, [])
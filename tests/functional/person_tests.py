@@ -1,4 +1,5 @@
 from django.test import TestCase
+from django.db import connection
 from account.models import Person, Account, Role, Group
 
 class MockRequest:
@@ -43,6 +44,69 @@ class PersonTests(TestCase):
         self.assertFalse(
             self.person_one.has_roles('(admin|guest)&superadmin')
         )
+        
+    def test_effective_roles_are_cached(self):
+        roles = self.person_one.effective_roles
+        assert roles == frozenset(['admin', 'guest'])
+        assert self.person_one.effective_roles is roles
+        
+        self.person_one.add_role('employee')
+        assert 'employee' in self.person_one.effective_roles
+        
+        self.person_one.group = Group.objects.get(name = 'Consultants')
+        assert 'consultant' in self.person_one.effective_roles
+        
+    def test_role_mask(self):
+        mask = self.person_one.role_mask
+        admin = Role.objects.get(name = 'admin')
+        guest = Role.objects.get(name = 'guest')
+        self.assertEqual(mask, admin.bit | guest.bit)
+        
+    def test_role_bits_are_dense(self):
+        """
+        Roles take the lowest free bits, whatever their ids,
+        and a deleted role's bit is reused.
+        """
+        self.person_one.role_mask
+        count = Role.objects.count()
+        indexes = [role.bit_index for role in Role.objects.all()]
+        self.assertEqual(sorted(indexes), range(count))
+        
+        guest = Role.objects.get(name = 'guest')
+        freed = guest.bit_index
+        guest.delete()
+        auditor = Role(name = 'auditor')
+        auditor.save()
+        self.assertEqual(auditor.bit_index, freed)
+        self.person_one.role_set.add(auditor)
+        self.person_one.invalidate_roles()
+        assert self.person_one.has_roles('auditor & admin')
+        assert not self.person_one.has_roles('guest')
+        
+    def test_role_added_by_another_process(self):
+        """
+        Roles created where our signals don't see them are
+        found once an expression uses their name.
+        """
+        from account.models import role
+        role.bits_by_name()
+        cursor = connection.cursor()
+        cursor.execute(
+            'INSERT INTO %s (name) VALUES (%%s)' % Role._meta.db_table, 
+            ['auditor'],
+        )
+        self.person_one.role_set.add(Role.objects.get(name = 'auditor'))
+        self.person_one.invalidate_roles()
+        role._bits_loaded = 0
+        assert self.person_one.has_roles('auditor')
+        
+    def test_role_names_are_not_substrings(self):
+        self.assertFalse(
+            self.person_one.has_roles('super_admin')
+        )
+        self.assertTrue(
+            self.person_one.has_roles('super_admin | admin')
+        )
     
     def test_check_password(self):
         self.assertTrue(
@@ -153,3 +217,32 @@ class PersonTests(TestCase):
             Person.load_from_request(request),
             None,
         )
+        
+    def test_load_with_account(self):
+        """
+        Loads person and account together, but only if the 
+        person belongs to the account at HTTP_HOST.
+        """
+        request = MockRequest()
+        request.META = {'HTTP_HOST': 'starr.localhost'}
+        self.person_one.login(request)
+        self.assertEquals(
+            Person.load_with_account(request),
+            self.person_one,
+        )
+        self.assertEquals(
+            request.account,
+            self.person_one.account,
+        )
+        
+        request = MockRequest()
+        request.META = {'HTTP_HOST': 'kristi.localhost'}
+        self.person_one.login(request)
+        self.assertEquals(
+            Person.load_with_account(request),
+            None,
+        )
+        self.assertEquals(
+            request.person,
+            None,
+        )
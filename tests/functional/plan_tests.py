@@ -0,0 +1,72 @@
+from django.test import TestCase
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from account.models import Account, Plan
+from account import subscription
+from account.tests.mocks import subscription_levels
+from account.tests.mocks.accounts import make_account
+
+class PlanTests(TestCase):
+    
+    def test_plans_in_db(self):
+        """
+        With SUBSCRIPTION_PLANS_IN_DB the catalog is built 
+        from the Plan tables and follows changes to them.
+        """
+        Plan.load_levels(settings.SUBSCRIPTION_LEVELS)
+        settings.SUBSCRIPTION_PLANS_IN_DB = True
+        try:
+            subscription.expire_catalog()
+            account = make_account(level = 2, people = 1)
+            self.assertEqual(account.subscription_level.handle, 'gold')
+            self.assertEqual(account.subscription_level.price, 20000)
+            assert account.subscription_level.resources['projects'] is subscription.Unlimited
+            assert subscription.catalog() is subscription.catalog()
+            
+            plan = Plan.objects.get(handle = 'gold')
+            plan.price = 25000
+            plan.save()
+            self.assertEqual(account.subscription_level.price, 25000)
+            
+            ssl = plan.resource_set.get(name = 'ssl')
+            ssl.limit = False
+            ssl.save()
+            assert not account.has_resource('ssl')
+            
+            # A bad edit keeps the last good plans in service.
+            ssl.value = 'lots'
+            ssl.save()
+            assert not account.has_resource('ssl')
+            self.assertEqual(account.subscription_level.price, 25000)
+            
+            ssl.value = 'yes'
+            ssl.save()
+            assert account.has_resource('ssl')
+        finally:
+            settings.SUBSCRIPTION_PLANS_IN_DB = False
+            subscription.expire_catalog()
+            
+    def test_load_levels_reorders_and_removes(self):
+        """
+        Reloading matches plans on handle, deletes plans no
+        longer listed, and moves accounts with their plans.
+        """
+        free, silver, gold = settings.SUBSCRIPTION_LEVELS
+        Plan.load_levels([free, silver, gold])
+        account = make_account(level = 2, people = 1)
+        gold_id = Plan.objects.get(handle = 'gold').id
+        
+        Plan.load_levels([gold, free])
+        self.assertEqual(
+            [(plan.position, plan.handle) for plan in Plan.objects.order_by('position')],
+            [(0, 'gold'), (1, 'free')],
+        )
+        self.assertEqual(Plan.objects.get(handle = 'gold').id, gold_id)
+        self.assertEqual(Account.objects.get(pk = account.id).subscription_level_id, 0)
+        
+    def test_load_levels_keeps_plans_in_use(self):
+        free, silver, gold = settings.SUBSCRIPTION_LEVELS
+        Plan.load_levels([free, silver, gold])
+        make_account(level = 2, people = 1)
+        self.assertRaises(ImproperlyConfigured, Plan.load_levels, [free, silver])
+        self.assertEqual(Plan.objects.count(), 3)
@@ -0,0 +1,50 @@
+from django.test import TestCase
+from django.core.exceptions import ImproperlyConfigured
+from account.policy import AccessPolicy
+
+class AccessPolicyTests(TestCase):
+    fixtures = ['test/roles.json']
+    
+    def test_roles_require_login(self):
+        policy = AccessPolicy(roles = 'admin | guest')
+        assert policy.requires_login
+        assert policy.roles.names == frozenset(['admin', 'guest'])
+        assert not AccessPolicy().requires_login
+        
+    def test_unknown_role(self):
+        # Unknown names are only reported when first used, so
+        # urls can load before the Role table exists.
+        policy = AccessPolicy(roles = 'admin & notarole')
+        try:
+            policy.check_roles()
+            assert False
+        except ImproperlyConfigured:
+            pass
+        AccessPolicy(roles = 'admin').check_roles()
+        
+    def test_invalid_expression(self):
+        try:
+            AccessPolicy(roles = 'admin &')
+            assert False
+        except ImproperlyConfigured:
+            pass
+    
+    def test_immutable(self):
+        policy = AccessPolicy(ssl = True)
+        try:
+            policy.ssl = False
+            assert False
+        except AttributeError:
+            pass
+        assert policy.ssl
+        
+    def test_from_meta(self):
+        meta = {'requires_logout': True, 'ssl': True}
+        policy = AccessPolicy.from_meta(meta)
+        assert policy.requires_logout and policy.ssl
+        assert policy.requires_account
+        assert AccessPolicy.from_meta(meta) is policy
+        assert AccessPolicy.from_meta(policy) is policy
+        
+        other = {'requires_logout': True, 'ssl': True}
+        assert AccessPolicy.from_meta(other) is not policy
@@ -0,0 +1,44 @@
+import threading
+from django.test import TestCase
+from account.lib.pool import WorkerPool
+
+class WorkerPoolTests(TestCase):
+    
+    def test_burst_runs_concurrently(self):
+        """
+        A burst of tasks after the pool has been used gets 
+        its own threads instead of queueing behind the idle 
+        one.
+        """
+        pool = WorkerPool(4)
+        try:
+            pool.submit(lambda: None).wait(5)
+            
+            lock = threading.Lock()
+            running = [0]
+            all_running = threading.Event()
+            def task():
+                lock.acquire()
+                running[0] += 1
+                if running[0] == 4:
+                    all_running.set()
+                lock.release()
+                all_running.wait(5)
+                return all_running.isSet()
+            tasks = [pool.submit(task) for i in range(4)]
+            self.assertEqual([t.wait(10) for t in tasks], [True] * 4)
+            self.assertEqual(len(pool._threads), 4)
+        finally:
+            pool.close()
+            
+    def test_size_is_a_limit(self):
+        pool = WorkerPool(2)
+        try:
+            release = threading.Event()
+            tasks = [pool.submit(release.wait) for i in range(5)]
+            self.assertEqual(len(pool._threads), 2)
+            release.set()
+            for t in tasks:
+                t.wait(5)
+        finally:
+            pool.close()
@@ -1,10 +1,14 @@
 from datetime import date, timedelta, datetime
+import os
+import tempfile
 import time
 from django.test import TestCase
 from account.models import Person, Account, Role, RecurringPayment
 from account.models import recurring_payment
 from account.lib.payment.errors import PaymentRequestError, PaymentResponseError
 from account.tests.mocks.payment_gateway import MockGateway
+from account.lib.repricing import Checkpoint, reprice
+from account.lib.payment.connections import ConnectionPool
 
 
 
@@ -89,6 +93,50 @@ class RecurringPaymentTests(TestCase):
         
         
         
+    def test_reprices_payments(self):
+        payment = self.make_payment()
+        payment.save()
+        payment.account.subscription_level_id = 1
+        payment.account.save()
+        path = tempfile.mktemp()
+        try:
+            changed, failed = reprice(
+                recurring_payment.gateway, 1, 2500, Checkpoint(path, 1, 2500), rate = 0,
+            )
+            self.assertEqual((changed, failed), (1, {}))
+            assert recurring_payment.gateway.change_payment_called
+            self.assertEqual(RecurringPayment.objects.get(pk = payment.id).amount, '$2500')
+            
+            # Restarting with the checkpoint has nothing left to do.
+            recurring_payment.gateway.reset()
+            changed, failed = reprice(
+                recurring_payment.gateway, 1, 2500, Checkpoint(path, 1, 2500), rate = 0,
+            )
+            self.assertEqual(changed, 0)
+            assert not recurring_payment.gateway.change_payment_called
+            
+            try:
+                Checkpoint(path, 1, 3000)
+                assert False
+            except ValueError:
+                pass
+        finally:
+            os.remove(path)
+            
+    def test_reprice_grows_connection_pool(self):
+        recurring_payment.gateway.pool = ConnectionPool(max_size = 2)
+        path = tempfile.mktemp()
+        try:
+            reprice(
+                recurring_payment.gateway, 1, 2500, Checkpoint(path, 1, 2500), 
+                concurrency = 6, rate = 0,
+            )
+            self.assertEqual(recurring_payment.gateway.pool.max_size, 6)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        
+        
     def test_cancels_payment(self):
         payment = self.make_payment()
         payment.cancel(
@@ -0,0 +1,83 @@
+from django.test import TestCase
+from account.models import Person, ResourceCount
+from account.tests.mocks import subscription_levels
+from account.tests.mocks.accounts import make_account
+
+class ResourceCountTests(TestCase):
+    
+    def test_resource_counter(self):
+        """
+        subscription.count regulators read a counter that 
+        follows creates and deletes.
+        """
+        account = make_account(level = 1, people = 9)
+        assert account.has_resource('people')
+        self.assertEqual(ResourceCount.current(account, 'account', 'Person'), 9)
+        
+        person = account.person_set.create(
+            username = 'extra',
+            password = 'password',
+            first_name = 'first_name',
+            last_name = 'last_name',
+            email = 'extra@email.com',
+        )
+        self.assertEqual(ResourceCount.current(account, 'account', 'Person'), 10)
+        assert not account.has_resource('people')
+        
+        person.delete()
+        self.assertEqual(ResourceCount.current(account, 'account', 'Person'), 9)
+        assert account.has_resource('people')
+        
+    def test_reconcile_resource_counter(self):
+        account = make_account(level = 1, people = 3)
+        ResourceCount.current(account, 'account', 'Person')
+        counter = ResourceCount.objects.get(account = account, resource = 'account.person')
+        counter.total = 42
+        counter.save()
+        
+        assert ResourceCount.reconcile() >= 1
+        self.assertEqual(ResourceCount.current(account, 'account', 'Person'), 3)
+        
+    def test_reconcile_creates_missing_counters(self):
+        account = make_account(level = 1, people = 2)
+        ResourceCount.objects.filter(account = account).delete()
+        
+        assert ResourceCount.reconcile() >= 1
+        counter = ResourceCount.objects.get(account = account, resource = 'account.person')
+        self.assertEqual(counter.total, 2)
+
+
+class ReservationTests(TestCase):
+    
+    def test_reserve_resource(self):
+        """
+        Reservations take units of a count() resource 
+        atomically and saving a claimed object doesn't 
+        count it twice.
+        """
+        account = make_account(level = 1, people = 8)
+        reservation = account.reserve_resource('people')
+        assert reservation is not None
+        person = Person(
+            account = account,
+            username = 'extra',
+            password = 'password',
+            first_name = 'first_name',
+            last_name = 'last_name',
+            email = 'extra@email.com',
+        )
+        reservation.claim(person)
+        person.save()
+        reservation.release()
+        self.assertEqual(ResourceCount.current(account, 'account', 'Person'), 9)
+        
+        last = account.reserve_resource('people')
+        assert last is not None
+        assert account.reserve_resource('people') is None
+        self.assertEqual(ResourceCount.current(account, 'account', 'Person'), 10)
+        last.release()
+        last.release()
+        self.assertEqual(ResourceCount.current(account, 'account', 'Person'), 9)
+        
+        assert account.reserve_resource('chat') is not None
+        assert account.reserve_resource('ssl') is None
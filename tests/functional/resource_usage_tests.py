@@ -0,0 +1,88 @@
+from django.test import TestCase
+from account.models import Account
+from account.models import accounts
+from account.tests.mocks import subscription_levels
+from account.tests.mocks.accounts import make_account
+
+class ResourceUsageTests(TestCase):
+    
+    def test_resource_usage(self):
+        """
+        All resources measured in one batch agree with
+        has_resource.
+        """
+        account = make_account(level = 2, people = 4)
+        usage = account.resource_usage()
+        self.assertEqual(usage['people'].used, 4)
+        self.assertEqual(usage['people'].limit, 10)
+        self.assertEqual(usage['disk'].used, 1000)
+        assert usage['projects'].unlimited
+        self.assertEqual(usage['projects'].used, None)
+        for resource in usage:
+            self.assertEqual(resource.allowed, account.has_resource(resource.name))
+        assert account.resource_usage() is usage
+        assert account.resource_usage(refresh = True) is not usage
+        
+        self.assertEqual(
+            account.check_resources(['ssl', 'people', 'projects', '']),
+            {'ssl': True, 'people': True, 'projects': True, '': True},
+        )
+        account.subscription_level_id = 1
+        self.assertEqual(
+            account.check_resources(['ssl', 'disk']),
+            {'ssl': False, 'disk': False},
+        )
+        
+    def test_has_resource_is_memoized(self):
+        """
+        Each regulator runs once per account instance until
+        a counted object is created or deleted.
+        """
+        account = make_account(level = 2, people = 9)
+        calls = []
+        def disk_used(account):
+            calls.append(account)
+            return 1000
+        old_disk_used, Account.disk_used = Account.disk_used, disk_used
+        try:
+            assert account.has_resource('disk')
+            assert account.has_resource('disk')
+            self.assertEqual(len(calls), 1)
+            
+            assert account.has_resource('people')
+            account.person_set.create(
+                username = 'extra',
+                password = 'password',
+                first_name = 'first_name',
+                last_name = 'last_name',
+                email = 'extra@email.com',
+            )
+            assert not account.has_resource('people')
+            assert account.has_resource('disk')
+            self.assertEqual(len(calls), 2)
+        finally:
+            Account.disk_used = old_disk_used
+            
+    def test_resource_changes_are_bounded(self):
+        """
+        Only recently changed accounts are remembered, and 
+        forgetting one drops memoized answers rather than 
+        serving stale ones.
+        """
+        account = make_account(level = 2, people = 1)
+        calls = []
+        def disk_used(account):
+            calls.append(account)
+            return 1000
+        old_disk_used, Account.disk_used = Account.disk_used, disk_used
+        old_size, accounts._resource_changes.max_size = accounts._resource_changes.max_size, 2
+        try:
+            assert account.has_resource('disk')
+            for account_id in range(-1, -5, -1):
+                accounts.resources_changed(account_id)
+            self.assertEqual(len(accounts._resource_changes), 2)
+            assert account.has_resource('disk')
+            self.assertEqual(len(calls), 2)
+        finally:
+            Account.disk_used = old_disk_used
+            accounts._resource_changes.max_size = old_size
@@ -0,0 +1,122 @@
+import datetime
+from django.conf import settings
+from django.test import TestCase
+from account.lib import sessions
+from account.middleware import DualSessionMiddleware
+
+class SessionStoreTests(TestCase):
+    
+    def expires(self, seconds=60):
+        return datetime.datetime.now() + datetime.timedelta(seconds = seconds)
+    
+    def check_round_trip(self, store):
+        key = store.save(None, {'a': 1}, self.expires())
+        assert key
+        self.assertEqual(store.load(key)[0], {'a': 1})
+        
+        # Saving under the same key replaces the data
+        key = store.save(key, {'a': 2}, self.expires())
+        self.assertEqual(store.load(key)[0], {'a': 2})
+        
+        # Touching moves the expiry only
+        later = self.expires(3600)
+        key = store.touch(key, {'a': 2}, later)
+        data, expire_date = store.load(key)
+        self.assertEqual(data, {'a': 2})
+        assert abs(later - expire_date) < datetime.timedelta(seconds = 1)
+        return key
+        
+    def test_database_store(self):
+        store = sessions.DatabaseStore()
+        key = self.check_round_trip(store)
+        store.delete(key)
+        assert store.load(key) is None
+        
+    def test_cache_store(self):
+        store = sessions.CacheStore()
+        key = self.check_round_trip(store)
+        store.delete(key)
+        assert store.load(key) is None
+        assert store.load('not a valid key') is None
+        
+    def test_cached_database_store(self):
+        store = sessions.CachedDatabaseStore()
+        key = self.check_round_trip(store)
+        # Survives losing the cache
+        store.cache.delete(store.prefix + key)
+        self.assertEqual(store.load(key)[0], {'a': 2})
+        
+    def test_signed_cookie_store(self):
+        store = sessions.SignedCookieStore()
+        value = self.check_round_trip(store)
+        payload, signature = value.split(':')
+        assert store.load(payload + ':' + '0' * len(signature)) is None
+        assert store.load('garbage') is None
+        
+        expired = store.save(None, {'a': 1}, self.expires(-60))
+        assert store.load(expired) is None
+        
+        # Signed with the derived key, not SECRET_KEY itself.
+        import hmac
+        from hashlib import sha1
+        from django.conf import settings
+        assert signature != hmac.new(settings.SECRET_KEY, payload, sha1).hexdigest()
+        
+    def test_sweep_expired(self):
+        store = sessions.DatabaseStore()
+        live = store.save(None, {}, self.expires())
+        for i in range(5):
+            store.save(None, {}, self.expires(-60))
+        
+        calls = []
+        deleted = sessions.sweep_expired(batch_size = 2, pause = 0, progress = calls.append)
+        self.assertEqual(deleted, 5)
+        # Three chunks of two keys, live or not.
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(calls[-1], 5)
+        assert store.load(live)
+        self.assertEqual(sessions.sweep_expired(), 0)
+        
+    def test_get_store(self):
+        assert isinstance(sessions.get_store('cache'), sessions.CacheStore)
+        assert isinstance(
+            sessions.get_store('account.lib.sessions.SignedCookieStore'), 
+            sessions.SignedCookieStore
+        )
+            
+    def test_refresh_fraction(self):
+        """
+        Unmodified sessions are only rewritten once they have 
+        used DUAL_SESSION_REFRESH_FRACTION of their age.
+        """
+        old = (
+            settings.SESSION_SAVE_EVERY_REQUEST, 
+            getattr(settings, 'DUAL_SESSION_REFRESH_FRACTION', None),
+            settings.SESSION_COOKIE_AGE,
+        )
+        try:
+            settings.SESSION_SAVE_EVERY_REQUEST = True
+            settings.DUAL_SESSION_REFRESH_FRACTION = 0.1
+            settings.SESSION_COOKIE_AGE = 1000
+            middleware = DualSessionMiddleware()
+            store = sessions.DatabaseStore()
+            
+            def session(seconds_left):
+                key = store.save(None, {'a': 1}, self.expires(seconds_left))
+                return sessions.StoreSessionWrapper(key, store)
+                
+            assert not middleware._needs_refresh(session(1000))
+            assert not middleware._needs_refresh(session(950))
+            assert middleware._needs_refresh(session(850))
+            assert not middleware._needs_refresh(
+                sessions.StoreSessionWrapper(None, store)
+            )
+            
+            settings.DUAL_SESSION_REFRESH_FRACTION = None
+            assert middleware._needs_refresh(session(1000))
+        finally:
+            (
+                settings.SESSION_SAVE_EVERY_REQUEST, 
+                settings.DUAL_SESSION_REFRESH_FRACTION,
+                settings.SESSION_COOKIE_AGE,
+            ) = old
@@ -0,0 +1,41 @@
+from django.test import TestCase
+from django.conf import settings
+from account.models import UsageSnapshot
+from account.models.usage_snapshot import measure_all
+from account import subscription
+from account.tests.mocks import subscription_levels
+from account.tests.mocks.accounts import make_account
+
+class UsageSnapshotTests(TestCase):
+    
+    def test_usage_snapshot(self):
+        """
+        A snapshot shows usage against every level's limits
+        without running regulators.
+        """
+        account = make_account(level = 1, people = 4)
+        snapshot = UsageSnapshot.refresh(account)
+        self.assertEqual(snapshot.used['people'], 4)
+        self.assertEqual(snapshot.used['disk'], 1000)
+        
+        levels = UsageSnapshot.for_account(account).levels()
+        self.assertEqual(len(levels), len(subscription.catalog()))
+        free, silver, gold = levels
+        self.assertEqual(silver['people'].used, 4)
+        self.assertEqual(silver['people'].limit, 10)
+        assert not silver['disk'].allowed
+        assert gold['disk'].allowed
+        assert gold['projects'].allowed
+        assert not silver['ssl'].allowed
+        
+    def test_usage_snapshot_of_bounded_count(self):
+        account = make_account(level = 1, people = 3)
+        old_regulators = settings.SUBSCRIPTION_REGULATORS
+        settings.SUBSCRIPTION_REGULATORS = dict(old_regulators)
+        settings.SUBSCRIPTION_REGULATORS['people'] = subscription.bounded(
+            subscription.count('account', 'Person'),
+        )
+        try:
+            self.assertEqual(measure_all(account)['people'], 3)
+        finally:
+            settings.SUBSCRIPTION_REGULATORS = old_regulators
@@ -0,0 +1,57 @@
+import datetime
+from django.test import TestCase
+from account.models import UsageEvent
+from account.models.usage import usage_buffer, UsageBuffer
+from account import subscription
+from account.tests.mocks import subscription_levels
+from account.tests.mocks.accounts import make_account
+
+class MeteredUsageTests(TestCase):
+    
+    def soon(self):
+        return datetime.datetime.now() + datetime.timedelta(seconds = 1)
+        
+    def test_usage_buffer_keeps_failed_events(self):
+        """
+        Events that can't be inserted stay buffered for the
+        next flush.
+        """
+        account = make_account(level = 1, people = 1)
+        buffer = UsageBuffer(batch_size = 100, max_age = 60)
+        buffer.add(account.id, 'emails', 3)
+        old_insert_many = UsageEvent.__dict__['insert_many']
+        def insert_many(events):
+            raise IOError('database went away')
+        UsageEvent.insert_many = staticmethod(insert_many)
+        try:
+            self.assertRaises(IOError, buffer.flush)
+        finally:
+            UsageEvent.insert_many = old_insert_many
+        buffer.add(account.id, 'emails', 1)
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(UsageEvent.objects.filter(account = account).count(), 2)
+        
+    def test_metered_usage(self):
+        """
+        Recorded usage reaches metered regulators once it
+        is flushed and rolled up.
+        """
+        account = make_account(level = 1, people = 1)
+        regulator = subscription.metered('emails')
+        subscription.record_usage(account, 'emails', 3)
+        subscription.record_usage(account, 'emails')
+        self.assertEqual(usage_buffer.flush(), 2)
+        self.assertEqual(regulator.usage(account), 0)
+        
+        # Recent events wait for SUBSCRIPTION_METER_ROLLUP_LAG.
+        self.assertEqual(UsageEvent.rollup(), 0)
+        self.assertEqual(UsageEvent.rollup(until = self.soon()), 1)
+        self.assertEqual(regulator.usage(account), 4)
+        assert not regulator(account, 4)
+        
+        subscription.record_usage(account, 'emails', 2)
+        usage_buffer.flush()
+        UsageEvent.rollup(until = self.soon())
+        self.assertEqual(UsageEvent.rollup(until = self.soon()), 0)
+        self.assertEqual(regulator.usage(account), 6)
+        self.assertEqual(UsageEvent.objects.filter(account = account).count(), 3)
@@ -0,0 +1,21 @@
+from account.models import Account
+
+
+def make_account(level=1, people=1):
+    """
+    Utility function: creates an account with
+    a specific subscription level and # people
+    """
+    account = Account(
+        subscription_level_id = level,
+    )
+    account.save()
+    for i in range(people):
+        account.person_set.create(
+            username = 'person %i' % i,
+            password = 'password %i' % i,
+            first_name = 'first_name %i' % i,
+            last_name = 'last_name %i' % i,
+            email = 'email_%i@email.com' % i,
+        )
+    return account
@@ -0,0 +1 @@
+from account.lib.payment.sample_responses import OK, ERROR, GARBAGE
@@ -0,0 +1,58 @@
+import httplib
+import socket
+from account.lib.payment.connections import ConnectionPool
+
+
+class MockResponse:
+    def __init__(self, body, will_close=False):
+        self.body = body
+        self.will_close = will_close
+        
+    def read(self):
+        return self.body
+        
+        
+class MockConnection:
+    """
+    Stands in for an httplib.HTTPConnection. `replies` are
+    returned by getresponse() in turn; exceptions among them
+    are raised. The socket is one end of a real socket pair,
+    so a test can close `server` to hang up on it.
+    """
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.requests = []
+        self.busy = False
+        self.sock, self.server = socket.socketpair()
+        
+    def request(self, method, path, body, headers):
+        if self.sock is None or self.busy:
+            raise httplib.CannotSendRequest()
+        self.requests.append(body)
+        
+    def getresponse(self):
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+        
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            
+            
+class MockConnectionPool(ConnectionPool):
+    """
+    A ConnectionPool that hands out the given MockConnections
+    instead of connecting.
+    """
+    def __init__(self, *connections):
+        ConnectionPool.__init__(self)
+        self.connections = list(connections)
+        self.opened = []
+        
+    def _connect(self, scheme, host):
+        connection = self.connections.pop(0)
+        self.opened.append(connection)
+        return connection
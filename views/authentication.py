@@ -47,7 +47,7 @@ def login(request):
                 return HttpResponseRedirect('/')
             elif request.person.has_roles('account_admin'):
                 import subscription
-                if request.account.subscription_level['price']:
+                if request.account.subscription_level.price:
                     return helpers.redirect(subscription.change_payment_method)
                 else:
                     return helpers.redirect(subscription.reactivate_free_account)
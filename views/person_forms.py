@@ -113,7 +113,7 @@ class SavesPayment(object):
         try:
             obj = RecurringPayment.create(
                 account = account, 
-                amount = subscription_level['price'], 
+                amount = subscription_level.price, 
                 card_number = self.cleaned_data['card_number'], 
                 card_expires = self.cleaned_data['card_expiration'], 
                 first_name = self.cleaned_data['first_name'],
@@ -4,9 +4,10 @@ from django.conf import settings
 from django.shortcuts import render_to_response
 from person_forms import SignupForm, PaymentForm, UpgradeForm, AccountForm
 from .. import helpers
-from ..models import Account, Person, RecurringPayment
+from ..models import Account, Person, RecurringPayment, UsageSnapshot
 from account.lib.payment.errors import PaymentRequestError, PaymentResponseError
 from django.core import mail
+from account import subscription
 
 
 def _email_cancel_error_to_admin(account, old_payment, new_payment=None):
@@ -65,13 +66,14 @@ def edit_account(request):
         'account/account_form.html',
         {
             'form': form,
-            'subscription_levels': settings.SUBSCRIPTION_LEVELS,
+            'subscription_levels': subscription.catalog(),
+            'plan_usage': UsageSnapshot.for_account(request.account).levels(),
         }
     )
     
 def reactivate_free_account(request):
     if request.method == 'POST':
-        if not request.account.subscription_level['price']:
+        if not request.account.subscription_level.price:
             request.account.active = True
             request.account.save()
         return HttpResponseRedirect('/')
@@ -186,14 +188,14 @@ def cancel_payment_method(request):
 def upgrade(request, level):
     level = int(level)
     try:
-        subscription_level = settings.SUBSCRIPTION_LEVELS[level]
+        subscription_level = subscription.catalog()[level]
     except (IndexError, ValueError):
         raise Http404
     
     # You can't switch to the free plan without canceling the
     # payment. That's more complexity than I want to deal with
     # right now. 
-    if not subscription_level['price']:
+    if not subscription_level.price:
         return HttpResponseForbidden("Sorry, but you can't switch to the free plan.")
     
     account = request.account
@@ -202,7 +204,7 @@ def upgrade(request, level):
     
     payment = request.account.recurring_payment
     
-    get_card_info = subscription_level.get('price') and not payment or not payment.is_active()
+    get_card_info = subscription_level.price and not payment or not payment.is_active()
     
     if request.method == 'POST':
         form = UpgradeForm(
@@ -223,7 +225,7 @@ def upgrade(request, level):
                     account.save()
                     
                 else:
-                    payment.change_amount(subscription_level['price'])
+                    payment.change_amount(subscription_level.price)
                     payment.save()
                 account.subscription_level_id = level
                 account.save()
@@ -251,6 +253,7 @@ def upgrade(request, level):
         {
             'form': form,
             'subscription_level': subscription_level,
+            'usage': UsageSnapshot.for_account(account).usage(subscription_level),
             'requires_payment': get_card_info,
         }
     )
@@ -270,11 +273,11 @@ def _delete_if_exists(*records):
     
 def create(request, level):
     try:
-        subscription_level = settings.SUBSCRIPTION_LEVELS[int(level)]
+        subscription_level = subscription.catalog()[int(level)]
     except (IndexError, ValueError):
         raise Http404
     
-    get_card_info = subscription_level.get('price')
+    get_card_info = subscription_level.price
     
 
     